@@ -0,0 +1,138 @@
+"""Условные запросы: ETag и Last-Modified для эндпоинтов чтения."""
+
+import hashlib
+import time
+from calendar import timegm
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+    quote_etag
+)
+from django.utils.http import http_date
+
+from recipes.models import Favorite
+from users.models import Follow, User
+
+CATALOG_VERSION_TIMEOUT = None
+
+
+def catalog_version(model):
+    """Версия справочника (теги, ингредиенты, профили) из общего кэша."""
+    key = f'catalog_version:{model._meta.label_lower}'
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        cache.add(key, version, CATALOG_VERSION_TIMEOUT)
+    return version
+
+
+def version_date(version):
+    """Время создания версии справочника."""
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def bump_catalog_version(model):
+    """Новая версия справочника после его изменения."""
+    cache.set(
+        f'catalog_version:{model._meta.label_lower}',
+        time.time_ns(),
+        CATALOG_VERSION_TIMEOUT
+    )
+
+
+def _relation_state(model, aggregate):
+    """Подзапрос с агрегатом по строкам пользователя в model."""
+    return Subquery(
+        model.objects.filter(user=OuterRef('pk')).order_by().values(
+            'user'
+        ).annotate(value=aggregate).values('value')
+    )
+
+
+def get_user_state(user):
+    """
+    Отпечаток данных пользователя, влияющих на ответы API.
+
+    Меняется при изменении избранного, подписок и списка покупок,
+    поэтому флаги is_favorited, is_subscribed и is_in_shopping_cart
+    не отдаются из кэша клиента устаревшими.
+    """
+    if not user.is_authenticated:
+        return None
+    return User.objects.filter(pk=user.pk).values_list(
+        'id',
+        'shopping_cart_version',
+        _relation_state(Favorite, Count('id')),
+        _relation_state(Favorite, Max('id')),
+        _relation_state(Follow, Count('id')),
+        _relation_state(Follow, Max('id')),
+    ).first()
+
+
+class ConditionalMixin:
+    """
+    Ответ 304 без сериализации для list и retrieve.
+
+    Вьюсет описывает данные, от которых зависит ответ, в
+    get_list_validators и get_object_validators: кортеж частей ETag
+    и время изменения (или None).
+    """
+
+    per_user = False
+
+    def get_list_validators(self):
+        """Части ETag и Last-Modified для списка."""
+        return None, None
+
+    def get_object_validators(self):
+        """Части ETag и Last-Modified для объекта."""
+        return None, None
+
+    def list(self, request, *args, **kwargs):
+        """Список с поддержкой условных запросов."""
+        return self.conditional_response(
+            self.get_list_validators(), super().list,
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """Объект с поддержкой условных запросов."""
+        return self.conditional_response(
+            self.get_object_validators(), super().retrieve,
+            request, *args, **kwargs
+        )
+
+    def conditional_response(self, validators, handler,
+                             request, *args, **kwargs):
+        """304, если валидаторы клиента совпали, иначе обычный ответ."""
+        parts, last_modified = validators
+        if parts is None:
+            return handler(request, *args, **kwargs)
+        parts = (request.get_full_path(), *parts)
+        if self.per_user:
+            user_state = get_user_state(request.user)
+            parts += (user_state,)
+            if user_state is not None:
+                last_modified = None
+        etag = quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+        timestamp = (
+            timegm(last_modified.utctimetuple()) if last_modified else None
+        )
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_cache_control(response, no_cache=True)
+            if timestamp:
+                response['Last-Modified'] = http_date(timestamp)
+            if self.per_user:
+                patch_vary_headers(response, ('Authorization',))
+                if request.user.is_authenticated:
+                    patch_cache_control(response, private=True)
+        return response
@@ -11,3 +11,16 @@ MAX_LEN_NAME_COLOR = 16
 MAX_LEN_USERNAME = 150
 MAX_LEN_SHORT_CODE = 20
 AMOUNT_LIMIT = 0.01
+MAX_LEN_FILE_FORMAT = 8
+MAX_LEN_JOB_STATUS = 16
+IMAGE_MAX_SIZE = 1920
+IMAGE_VARIANT_FORMAT = 'WEBP'
+IMAGE_VARIANT_QUALITY = 80
+RECIPE_IMAGE_VARIANTS = {'card': (360, 360), 'detail': (960, 960)}
+AVATAR_IMAGE_VARIANTS = {'avatar': (160, 160)}
+IMAGE_VARIANTS_DIR = 'variants'
+MEDIA_HASH_LENGTH = 32
+MAX_BULK_RECIPES = 100
+MAX_LEN_COUNTER_NAME = 16
+RECIPE_SEARCH_CONFIG = 'russian'
+MAX_PANTRY_INGREDIENTS = 200
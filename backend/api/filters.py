@@ -1,15 +1,19 @@
 """Фильтры API."""
 
-from django.db.models import Q
+from django.db.models import Case, Count, IntegerField, Value, When
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe, Tag, normalize_search_name
 
 
 class IngredientFilter(FilterSet):
-    """Фильтр ингредиентов по названию."""
+    """
+    Фильтр ингредиентов по названию.
 
-    name = filters.CharFilter(lookup_expr='icontains')
+    Сначала совпадения по началу названия, затем по подстроке.
+    """
+
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         """class Meta IngredientFilter."""
@@ -17,30 +21,70 @@ class IngredientFilter(FilterSet):
         model = Ingredient
         fields = ('name', )
 
+    def filter_name(self, queryset, name, value):
+        """Поиск по нормализованному ключу с ранжированием."""
+        value = normalize_search_name(value)
+        if not value:
+            return queryset
+        return queryset.filter(search_name__contains=value).annotate(
+            match_rank=Case(
+                When(search_name__startswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('match_rank', 'name')
+
 
 class RecipeFilter(FilterSet):
-    """Фильтр рецептов по автору/тегу/подписке/наличию в списке покупок."""
+    """
+    Фильтр рецептов по автору/тегу/подписке/наличию в списке покупок.
+
+    Параметр search включает полнотекстовый поиск по названию и описанию
+    с сортировкой по релевантности.
+    """
+
+    TAGS_MODES = (
+        ('any', 'Любой из тегов'),
+        ('all', 'Все теги'),
+    )
 
     tags = filters.CharFilter(method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES, method='filter_tags_mode'
+    )
     author = filters.NumberFilter(field_name='author__id')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         """class Meta RecipeFilter."""
 
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
 
     def filter_tags(self, queryset, name, value):
-        """Фильтрация по нескольким тегам, переданным через параметр 'tags'."""
-        tags = self.request.query_params.getlist('tags')
-        if tags:
-            query = Q()
-            for tag in tags:
-                query |= Q(tags__slug=tag)
-            queryset = queryset.filter(query).distinct()
+        """
+        Фильтрация по нескольким тегам, переданным через параметр 'tags'.
+
+        Подзапрос по таблице связей вместо JOIN, поэтому DISTINCT не нужен.
+        При tags_mode=all остаются рецепты со всеми переданными тегами.
+        """
+        tags = set(self.request.query_params.getlist('tags'))
+        if not tags:
+            return queryset
+        recipe_tags = Recipe.tags.through.objects.filter(tag__slug__in=tags)
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            recipe_tags = recipe_tags.values('recipe_id').annotate(
+                tags_count=Count('tag_id')
+            ).filter(tags_count=len(tags))
+        return queryset.filter(id__in=recipe_tags.values('recipe_id'))
+
+    def filter_tags_mode(self, queryset, name, value):
+        """Режим учитывается в filter_tags."""
         return queryset
 
     def filter_is_favorited(self, queryset, name, value):
@@ -59,6 +103,10 @@ class RecipeFilter(FilterSet):
             return queryset.none()
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """Поиск по названию и описанию."""
+        return queryset.search(value)
+
 
 class TagFilter(FilterSet):
     """Фильтр тегов."""
@@ -0,0 +1,11 @@
+"""Выбор рендерера."""
+
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FileFormatNegotiation(DefaultContentNegotiation):
+    """Параметр format задаёт формат файла, а не рендерер ответа."""
+
+    def filter_renderers(self, renderers, format):
+        """Рендереры не фильтруются по format, его обрабатывает view."""
+        return renderers
@@ -1,12 +1,177 @@
 """Пагинаторы."""
 
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 PAGE_SIZE = 6
 
 
 class LimitPagination(PageNumberPagination):
-    """Пагинатор."""
+    """
+    Пагинатор.
+
+    По умолчанию постраничный. Вьюсеты с атрибутом cursor_ordering
+    поддерживают режим pagination=cursor: выборка по ключу без COUNT(*)
+    и OFFSET, с непрозрачными курсорами next/previous.
+    """
 
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Страница в выбранном режиме пагинации."""
+        self.ordering = getattr(view, 'cursor_ordering', None)
+        self.cursor_mode = bool(self.ordering) and (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request, queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self.invert(field) for field in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+        self.next_position = (
+            self.position(results[-1]) if has_next and results else None
+        )
+        self.previous_position = (
+            self.position(results[0]) if has_previous and results else None
+        )
+        return results
+
+    def get_paginated_response(self, data):
+        """Ответ со ссылками; в режиме курсора без count."""
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict((
+            ('next', self.cursor_link(self.next_position, False)),
+            ('previous', self.cursor_link(self.previous_position, True)),
+            ('results', data),
+        )))
+
+    @staticmethod
+    def invert(field):
+        """Обратное направление сортировки поля."""
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, position):
+        """Условие «строго после position» для составного ключа."""
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = {
+                previous.lstrip('-'): value
+                for previous, value in zip(ordering[:index], position)
+            }
+            condition[f'{name}__{lookup}'] = position[index]
+            conditions.append(Q(**condition))
+        return reduce(or_, conditions)
+
+    def position(self, instance):
+        """Значения ключа сортировки для объекта."""
+        return [
+            getattr(instance, field.lstrip('-')) for field in self.ordering
+        ]
+
+    def cursor_link(self, position, reverse):
+        """Ссылка на соседнюю страницу."""
+        if position is None:
+            return None
+        cursor = urlsafe_b64encode(json.dumps(
+            {'r': reverse, 'p': [
+                value.isoformat() if hasattr(value, 'isoformat') else value
+                for value in position
+            ]}
+        ).encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """Направление и позиция из параметра cursor."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return False, None
+        try:
+            data = json.loads(urlsafe_b64decode(cursor.encode()))
+            position = data['p']
+            reverse = bool(data['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+            len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, position
+
+
+class FeedPagination(LimitPagination):
+    """
+    Пагинатор ленты подписок.
+
+    Только по ключу (pub_date, recipe_id) и только вперёд: лента
+    собирается из нескольких источников, каждый из которых читается
+    не дальше одной страницы после курсора. Рецепт, пришедший из
+    нескольких источников, попадает в страницу один раз.
+    """
+
+    ordering = ('-pub_date', '-recipe_id')
+
+    def paginate_sources(self, sources, request):
+        """Id рецептов страницы из источников с pub_date и recipe_id."""
+        self.request = request
+        self.cursor_mode = True
+        page_size = self.get_page_size(request)
+        _, position = self.decode_cursor(request, sources[0].model)
+        keys = {}
+        for source in sources:
+            source = source.order_by(*self.ordering)
+            if position is not None:
+                source = source.filter(self.after(self.ordering, position))
+            for pub_date, recipe_id in source.values_list(*(
+                field.lstrip('-') for field in self.ordering
+            ))[:page_size + 1]:
+                keys[recipe_id] = max(
+                    keys.get(recipe_id, (pub_date, recipe_id)),
+                    (pub_date, recipe_id)
+                )
+        keys = sorted(keys.values(), reverse=True)
+        self.next_position = (
+            list(keys[page_size - 1]) if len(keys) > page_size else None
+        )
+        self.previous_position = None
+        return [recipe_id for _, recipe_id in keys[:page_size]]
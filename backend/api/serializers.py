@@ -9,8 +9,13 @@ from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
 
+from api.constants import (AVATAR_IMAGE_VARIANTS, MAX_BULK_RECIPES,
+                           MAX_PANTRY_INGREDIENTS, RECIPE_IMAGE_VARIANTS)
+from recipes.images import cap_image, variant_urls
+from recipes.ingredients import changing_ingredients
 from recipes.models import (
-    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    ShoppingListItem, ShoppingListJob, Tag
 )
 from users.models import Follow, User
 
@@ -47,7 +52,11 @@ class UsersCreateSerializer(UserCreateSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
-    """Кастомное поле для кодирования изображения в base64."""
+    """
+    Кастомное поле для кодирования изображения в base64.
+
+    Слишком большие картинки уменьшаются до IMAGE_MAX_SIZE.
+    """
 
     def to_internal_value(self, data):
         """Кодирование изображения."""
@@ -56,13 +65,34 @@ class Base64ImageField(serializers.ImageField):
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr), name='photo.' + ext)
 
-        return super().to_internal_value(data)
+        return cap_image(super().to_internal_value(data))
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки."""
+
+    def __init__(self, variants, **kwargs):
+        """Поле только для чтения с набором вариантов."""
+        self.variants = variants
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        """Словарь вариант: ссылка."""
+        if not value:
+            return None
+        return variant_urls(
+            value, self.variants, self.context.get('request')
+        )
 
 
 class UserAvatarSerializer(serializers.Serializer):
     """Сериализатор для аватара пользователя."""
 
     avatar = Base64ImageField(allow_null=True, required=True)
+    avatar_variants = ImageVariantsField(
+        AVATAR_IMAGE_VARIANTS, source='avatar'
+    )
 
     def update(self, instance, validated_data):
         """Обновление аватара."""
@@ -76,6 +106,9 @@ class UsersSerializer(UserSerializer):
 
     is_subscribed = SerializerMethodField(read_only=True)
     avatar = Base64ImageField(allow_null=True, required=False)
+    avatar_variants = ImageVariantsField(
+        AVATAR_IMAGE_VARIANTS, source='avatar'
+    )
 
     class Meta:
         """class Meta отображение информации о пользователи."""
@@ -88,6 +121,7 @@ class UsersSerializer(UserSerializer):
             'first_name',
             'last_name',
             'avatar',
+            'avatar_variants',
             'is_subscribed',
         )
 
@@ -96,6 +130,8 @@ class UsersSerializer(UserSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(object, 'is_subscribed'):
+            return object.is_subscribed
         return Follow.objects.filter(user=user, author=object.id).exists()
 
     def get_avatar(self, obj):
@@ -121,17 +157,50 @@ class FollowSerializer(UsersSerializer):
     def get_recipes(self, object):
         """Возвращает рецепты пользователя."""
         request = self.context.get('request')
-        recipe_limit = request.query_params.get('recipes_limit')
-        queryset = object.recipes.all()
-        if recipe_limit:
-            queryset = queryset[:int(recipe_limit)]
+        if hasattr(object, 'limited_recipes'):
+            queryset = object.limited_recipes
+        else:
+            queryset = object.recipes.all()
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit:
+                queryset = queryset[:recipes_limit]
         return RecipeInfoSerializer(
             queryset, context={'request': request}, many=True
         ).data
 
     def get_recipes_count(self, object):
         """Возвращает количество рецептов пользователя."""
-        return object.recipes.count()
+        return object.recipes_count
+
+
+class RecipesLimitSerializer(serializers.Serializer):
+    """Валидация параметра recipes_limit."""
+
+    recipes_limit = serializers.IntegerField(min_value=1, required=False)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES
+    )
+
+    def validate_ids(self, value):
+        """id без повторов в исходном порядке."""
+        return list(dict.fromkeys(value))
+
+
+class PantrySerializer(serializers.Serializer):
+    """Список id ингредиентов в наличии."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_PANTRY_INGREDIENTS
+    )
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -213,18 +282,19 @@ class RecipeSerializer(serializers.ModelSerializer):
         """Валидация тегов и ингредиентов."""
         required_fields = ('ingredients', 'tags')
         for field in required_fields:
-            if field not in data:
+            if field not in data and not self.partial:
                 raise ValidationError({field: 'Обязательное поле'})
-        if not data['ingredients']:
-            raise ValidationError(
-                {'error': 'Должен быть, хотя бы один игридиент'}
-            )
-        list_ingr = [item['ingredient'] for item in data['ingredients']]
-        if len(list_ingr) != len(set(list_ingr)):
-            raise ValidationError(
-                {'error': 'Ингредиенты должны быть уникальными'}
-            )
-        if len(data['tags']) != len(set(data['tags'])):
+        if 'ingredients' in data:
+            if not data['ingredients']:
+                raise ValidationError(
+                    {'error': 'Должен быть, хотя бы один игридиент'}
+                )
+            list_ingr = [item['ingredient'] for item in data['ingredients']]
+            if len(list_ingr) != len(set(list_ingr)):
+                raise ValidationError(
+                    {'error': 'Ингредиенты должны быть уникальными'}
+                )
+        if 'tags' in data and len(data['tags']) != len(set(data['tags'])):
             raise ValidationError(
                 {'error': 'Теги не должны повторяться'}
             )
@@ -232,12 +302,13 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def get_ingredients(self, recipe, ingredients):
         """Получение ингредиентов."""
-        RecipeIngredient.objects.bulk_create(
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=ingredient.get('ingredient'),
-                amount=ingredient.get('amount')
-            ) for ingredient in ingredients)
+        with changing_ingredients((recipe.id,)):
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredient.get('ingredient'),
+                    amount=ingredient.get('amount')
+                ) for ingredient in ingredients)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -252,16 +323,54 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Изменение ингредиентов по разнице с текущими.
+
+        Добавляются новые, меняется количество у изменённых и удаляются
+        убранные строки. Списки покупок пересчитываются, только если
+        ингредиенты действительно изменились.
+        """
+        amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients
+        }
+        existing = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        removed = existing.keys() - amounts.keys()
+        added = [
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        changed = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id, item.amount)
+            if amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        if not (removed or added or changed):
+            return
+        with changing_ingredients((recipe.id,)):
+            if removed:
+                RecipeIngredient.objects.filter(
+                    recipe=recipe, ingredient_id__in=removed
+                ).delete()
+            RecipeIngredient.objects.bulk_create(added)
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        """Обновление рецепта."""
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-
-        instance.tags.set(tags)
-        self.get_ingredients(instance, ingredients)
+        """Обновление рецепта, не переданные теги и ингредиенты не меняются."""
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
 
         return super().update(instance, validated_data)
 
@@ -275,6 +384,9 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для краткого отображения рецепта."""
 
     image = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField(
+        RECIPE_IMAGE_VARIANTS, source='image'
+    )
 
     def get_image(self, obj):
         """Получить картинку рецепта."""
@@ -284,18 +396,22 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         """Meta class краткое отображение рецепта."""
 
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time',)
 
 
 class RecipeForUserSerializer(serializers.ModelSerializer):
     """Сериализатор для пользователя с рецептами."""
 
+    image_variants = ImageVariantsField(
+        RECIPE_IMAGE_VARIANTS, source='image'
+    )
+
     class Meta:
         """Meta class рецетов."""
 
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class GetRecipeSerializer(serializers.ModelSerializer):
@@ -308,6 +424,10 @@ class GetRecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField(
+        RECIPE_IMAGE_VARIANTS, source='image'
+    )
+    favorites_count = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         """Meta class полная информация рецепта."""
@@ -315,15 +435,23 @@ class GetRecipeSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
-            'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'is_favorited', 'is_in_shopping_cart', 'favorites_count',
+            'name', 'image', 'image_variants', 'text', 'cooking_time'
         )
 
+    def get_favorites_count(self, object):
+        """Сколько раз рецепт добавлен в избранное."""
+        if hasattr(object, 'favorites_total'):
+            return object.favorites_total
+        return object.favorites_count
+
     def get_is_favorited(self, object):
         """Получить избранный рецепт."""
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(object, 'favorited'):
+            return object.favorited
         return object.favorite.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, object):
@@ -331,6 +459,8 @@ class GetRecipeSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(object, 'in_shopping_cart'):
+            return object.in_shopping_cart
         return object.shopping_cart.filter(user=user).exists()
 
 
@@ -343,15 +473,6 @@ class FavoriteSerializer(serializers.ModelSerializer):
         model = Favorite
         fields = ('user', 'recipe')
 
-    def validate(self, data):
-        """Валидация на сущестования рецепта."""
-        user, recipe = data.get('user'), data.get('recipe')
-        if self.Meta.model.objects.filter(user=user, recipe=recipe).exists():
-            raise ValidationError(
-                {'error': 'Этот рецепт уже добавлен'}
-            )
-        return data
-
     def to_representation(self, instance):
         """Отображение краткой информации рецепта."""
         context = {'request': self.context.get('request')}
@@ -367,13 +488,45 @@ class ShoppingCartSerializer(FavoriteSerializer):
         model = ShoppingCart
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """Сериализатор ингредиента в списке покупок."""
+
+    id = serializers.IntegerField(source='ingredient_id', read_only=True)
+    name = serializers.CharField(source='ingredient.name', read_only=True)
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit', read_only=True
+    )
+
+    class Meta:
+        """Meta class списка покупок."""
+
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class ShoppingListJobSerializer(serializers.ModelSerializer):
+    """Сериализатор задания на генерацию списка покупок."""
+
+    format = serializers.CharField(source='file_format', read_only=True)
+
+    class Meta:
+        """Meta class задания."""
+
+        model = ShoppingListJob
+        fields = ('id', 'status', 'format', 'created')
+        read_only_fields = fields
+
+
 class RecipeInfoSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения краткой информации о рецепте."""
 
     image = Base64ImageField(required=False, allow_null=True)
+    image_variants = ImageVariantsField(
+        RECIPE_IMAGE_VARIANTS, source='image'
+    )
 
     class Meta:
         """Meta class краткой информации."""
 
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
@@ -0,0 +1,60 @@
+"""Короткие ссылки на рецепты."""
+
+from django.core.cache import cache
+
+from recipes.models import Recipe
+
+SHORT_CODE_ALPHABET = (
+    '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+)
+SHORT_CODE_MAX_LENGTH = 11
+SHORT_LINK_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def encode_short_code(recipe_id):
+    """Короткий код рецепта: id в base62."""
+    base = len(SHORT_CODE_ALPHABET)
+    code = ''
+    while True:
+        recipe_id, digit = divmod(recipe_id, base)
+        code = SHORT_CODE_ALPHABET[digit] + code
+        if not recipe_id:
+            return code
+
+
+def decode_short_code(code):
+    """id рецепта из короткого кода или None."""
+    if not code or len(code) > SHORT_CODE_MAX_LENGTH:
+        return None
+    base = len(SHORT_CODE_ALPHABET)
+    recipe_id = 0
+    for char in code:
+        digit = SHORT_CODE_ALPHABET.find(char)
+        if digit < 0:
+            return None
+        recipe_id = recipe_id * base + digit
+    return recipe_id
+
+
+def short_link_key(recipe_id):
+    """Ключ общего кэша для рецепта короткой ссылки."""
+    return f'short_link:{recipe_id}'
+
+
+def resolve_short_code(code):
+    """
+    id рецепта по короткому коду.
+
+    Сначала общий кэш, затем база. Запись кэша удаляется вместе с
+    рецептом. Неизвестные коды не кэшируются: для них бросается
+    LookupError.
+    """
+    recipe_id = decode_short_code(code)
+    if recipe_id is None:
+        raise LookupError(code)
+    key = short_link_key(recipe_id)
+    if cache.get(key) is None:
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            raise LookupError(code)
+        cache.set(key, recipe_id, SHORT_LINK_CACHE_TIMEOUT)
+    return recipe_id
@@ -0,0 +1,82 @@
+"""Тесты API."""
+
+import csv
+from io import StringIO
+from tempfile import SpooledTemporaryFile
+
+from django.test import SimpleTestCase, TestCase
+
+from api.short_links import encode_short_code, resolve_short_code
+from api.utils import SHOPPING_LIST_FORMATS
+from recipes.models import Recipe
+from users.models import User
+
+INGREDIENTS = [
+    {
+        'ingredient__name': 'Мука',
+        'ingredient__measurement_unit': 'г',
+        'total': 500,
+    },
+    {
+        'ingredient__name': 'Соль, йодированная',
+        'ingredient__measurement_unit': 'щепотка',
+        'total': 1,
+    },
+]
+
+
+class ShoppingListRenderTest(SimpleTestCase):
+    """Документы списка покупок во всех форматах."""
+
+    def render(self, file_format, max_size=0):
+        """Байты документа, записанного в SpooledTemporaryFile."""
+        render, _ = SHOPPING_LIST_FORMATS[file_format]
+        with SpooledTemporaryFile(max_size=max_size) as file:
+            render(iter(INGREDIENTS), file)
+            file.seek(0)
+            return file.read()
+
+    def test_all_formats_render_into_spooled_file(self):
+        """Каждый формат пишется и в памяти, и после сброса на диск."""
+        for file_format in SHOPPING_LIST_FORMATS:
+            for max_size in (0, 1):
+                with self.subTest(file_format=file_format, max_size=max_size):
+                    self.assertTrue(self.render(file_format, max_size))
+
+    def test_csv_rows(self):
+        """CSV в UTF-8 с заголовком и экранированием запятых."""
+        rows = list(csv.reader(StringIO(self.render('csv').decode('utf-8'))))
+        self.assertEqual(rows, [
+            ['name', 'amount', 'measurement_unit'],
+            ['Мука', '500', 'г'],
+            ['Соль, йодированная', '1', 'щепотка'],
+        ])
+
+    def test_text_lines(self):
+        """Текст с нумерацией ингредиентов."""
+        self.assertIn('2. Соль, йодированная – 1 щепотка', self.render(
+            'txt'
+        ).decode())
+
+    def test_pdf_header(self):
+        """PDF-документ."""
+        self.assertTrue(self.render('pdf').startswith(b'%PDF'))
+
+
+class ShortLinkTest(TestCase):
+    """Разрешение коротких ссылок."""
+
+    def test_deleted_recipe_is_not_resolved(self):
+        """После удаления рецепта код не разрешается из кэша."""
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст',
+            cooking_time=1, image='recipes/images/recipe.png'
+        )
+        code = encode_short_code(recipe.id)
+        self.assertEqual(resolve_short_code(code), recipe.id)
+        recipe.delete()
+        with self.assertRaises(LookupError):
+            resolve_short_code(code)
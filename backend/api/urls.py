@@ -7,13 +7,19 @@ from rest_framework.routers import DefaultRouter
 
 from users.views import UsersViewSet
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import (
+    IngredientViewSet, RecipeViewSet, ShoppingListJobViewSet, TagViewSet
+)
 
 router = DefaultRouter()
 router.register(r'users', UsersViewSet)
 router.register(r'ingredients', IngredientViewSet)
 router.register(r'recipes', RecipeViewSet)
 router.register(r'tags', TagViewSet)
+router.register(
+    r'shopping_list_jobs', ShoppingListJobViewSet,
+    basename='shoppinglistjob'
+)
 urlpatterns = [
     path('', include(router.urls)),
     path('', include('djoser.urls')),
@@ -0,0 +1,132 @@
+"""Список покупок: агрегация ингредиентов и генерация файлов."""
+
+import csv
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.db.models import F
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics, ttfonts
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+FONT_NAME = 'Arial'
+FONT_PATH = settings.BASE_DIR / 'data' / 'arial.ttf'
+TITLE_FONT_SIZE = 16
+FONT_SIZE = 12
+LINE_HEIGHT = 20
+MARGIN_LEFT = 60
+MARGIN_TOP = 60
+MARGIN_BOTTOM = 50
+CSV_BUFFER_SIZE = 64 * 1024
+
+
+def register_font():
+    """Регистрирует шрифт в reportlab один раз на процесс."""
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(ttfonts.TTFont(FONT_NAME, FONT_PATH))
+
+
+def get_shopping_list(user):
+    """Суммарное количество каждого ингредиента из корзины пользователя."""
+    return ShoppingListItem.objects.filter(user=user).values(
+        'ingredient_id', 'ingredient__name', 'ingredient__measurement_unit',
+        total=F('amount')
+    ).order_by('ingredient__name', 'ingredient_id')
+
+
+def shopping_list_cache_key(user, file_format):
+    """Ключ кэша документа для текущей версии списка покупок."""
+    return (
+        f'shopping_list:{user.id}:{user.shopping_cart_version}:{file_format}'
+    )
+
+
+def shopping_list_etag(request, *args, **kwargs):
+    """ETag документа: пользователь, версия списка и формат."""
+    file_format = request.query_params.get('format', 'pdf')
+    if file_format not in SHOPPING_LIST_FORMATS:
+        return None
+    return shopping_list_cache_key(request.user, file_format)
+
+
+def render_shopping_list_text(ingredients, file):
+    """Записывает список покупок в file обычным текстом."""
+    file.write('Список покупок\n\n'.encode())
+    for number, item in enumerate(ingredients, start=1):
+        file.write((
+            f"{number}. {item['ingredient__name']} – {item['total']} "
+            f"{item['ingredient__measurement_unit']}\n"
+        ).encode())
+
+
+def render_shopping_list_csv(ingredients, file):
+    """
+    Записывает список покупок в file в формате CSV.
+
+    Строки пишутся через текстовый буфер и копируются в file байтами:
+    SpooledTemporaryFile до Python 3.11 нельзя обернуть в TextIOWrapper.
+    """
+    buffer = StringIO(newline='')
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'amount', 'measurement_unit'))
+    for item in ingredients:
+        writer.writerow((
+            item['ingredient__name'], item['total'],
+            item['ingredient__measurement_unit']
+        ))
+        if buffer.tell() >= CSV_BUFFER_SIZE:
+            file.write(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+    file.write(buffer.getvalue().encode('utf-8'))
+
+
+def render_shopping_list_pdf(ingredients, file):
+    """Записывает список покупок в file, перенося строки на новые страницы."""
+    register_font()
+    width, height = A4
+    pdf = canvas.Canvas(file, pagesize=A4)
+    page = 1
+
+    def start_page():
+        pdf.setFont(FONT_NAME, FONT_SIZE)
+        pdf.drawRightString(
+            width - MARGIN_LEFT, MARGIN_BOTTOM / 2, str(page)
+        )
+        return height - MARGIN_TOP
+
+    y = start_page()
+    pdf.setFont(FONT_NAME, TITLE_FONT_SIZE)
+    pdf.drawString(MARGIN_LEFT, y, 'Список покупок')
+    pdf.setFont(FONT_NAME, FONT_SIZE)
+    y -= LINE_HEIGHT * 2
+    for number, item in enumerate(ingredients, start=1):
+        if y < MARGIN_BOTTOM:
+            pdf.showPage()
+            page += 1
+            y = start_page()
+        pdf.drawString(
+            MARGIN_LEFT, y,
+            f"{number}. {item['ingredient__name']} – {item['total']} "
+            f"{item['ingredient__measurement_unit']}"
+        )
+        y -= LINE_HEIGHT
+    pdf.showPage()
+    pdf.save()
+
+
+SHOPPING_LIST_FORMATS = {
+    'pdf': (render_shopping_list_pdf, 'application/pdf'),
+    'txt': (render_shopping_list_text, 'text/plain; charset=utf-8'),
+    'csv': (render_shopping_list_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def render_shopping_list(file_format, ingredients):
+    """Документ списка покупок в виде байтов; вызывается в пуле процессов."""
+    render, content_type = SHOPPING_LIST_FORMATS[file_format]
+    file = BytesIO()
+    render(ingredients, file)
+    return file.getvalue()
@@ -1,29 +1,71 @@
 
 """View сlass рецепты."""
 
-from django.http import HttpResponse
+from tempfile import SpooledTemporaryFile
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponsePermanentRedirect
+)
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from django_short_url.views import get_surl
-from reportlab.pdfbase import pdfmetrics, ttfonts
-from reportlab.pdfgen import canvas
-from rest_framework import status, viewsets
+from django_short_url.views import short_url_redirect
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.feed import feed_sources
+from recipes.models import (
+    Favorite, Ingredient, Recipe, ShoppingCart, ShoppingListItem,
+    ShoppingListJob, Tag
+)
+from recipes.pantry import get_pantry_index
+from recipes.relations import (add_user_recipes, remove_user_recipe,
+                               remove_user_recipes)
+from users.models import User
 
+from .conditional import ConditionalMixin, catalog_version, version_date
 from .filters import IngredientFilter, RecipeFilter, TagFilter
-from .paginations import LimitPagination
+from .negotiation import FileFormatNegotiation
+from .paginations import FeedPagination, LimitPagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (
-    FavoriteSerializer, IngredientSerializer, RecipeSerializer,
-    ShoppingCartSerializer, TagSerializer
+    FavoriteSerializer, IngredientSerializer, PantrySerializer,
+    RecipeIdsSerializer, RecipeSerializer, ShoppingCartSerializer,
+    ShoppingListItemSerializer, ShoppingListJobSerializer,
+    ShortRecipeSerializer, TagSerializer
 )
+from .short_links import encode_short_code, resolve_short_code
+from .utils import (
+    SHOPPING_LIST_FORMATS, get_shopping_list, shopping_list_cache_key,
+    shopping_list_etag
+)
+
+SHOPPING_LIST_SPOOL_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_CACHE_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+SHORT_LINK_MAX_AGE = 60 * 60 * 24
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class CatalogViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    """Справочник, ETag которого зависит от версии справочника."""
+
+    def get_list_validators(self):
+        """Версия справочника."""
+        return (catalog_version(self.queryset.model),), None
+
+    def get_object_validators(self):
+        """Версия справочника."""
+        return self.get_list_validators()
+
+
+class IngredientViewSet(CatalogViewSet):
     """Вьюсет для обработки запросов на получение ингредиентов."""
 
     queryset = Ingredient.objects.all()
@@ -34,7 +76,7 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogViewSet):
     """Вьюсет для обработки запросов на получение тегов."""
 
     queryset = Tag.objects.all()
@@ -44,7 +86,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = TagFilter
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalMixin, viewsets.ModelViewSet):
     """
     Вьюсет для работы с рецептами.
 
@@ -58,28 +100,74 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = LimitPagination
+    cursor_ordering = ('-pub_date', 'id')
+    per_user = True
+
+    def get_queryset(self):
+        """Рецепты с аннотациями для текущего пользователя."""
+        return Recipe.objects.for_read(self.request.user)
+
+    @staticmethod
+    def get_catalog_versions():
+        """Версии тегов, ингредиентов и профилей, встроенных в рецепты."""
+        return tuple(
+            catalog_version(model) for model in (Tag, Ingredient, User)
+        )
+
+    def get_list_validators(self):
+        """
+        Отпечаток отфильтрованных рецептов: количество и изменения.
+
+        Время изменения учитывает и счётчики избранного и корзин. Только
+        ETag: удаление не самого нового рецепта не сдвигает дату, а
+        количество в ETag входит.
+        """
+        mode = self.request.query_params.get(self.paginator.mode_query_param)
+        if mode == 'cursor':
+            return None, None
+        state = self.filter_queryset(Recipe.objects.all()).change_state()
+        return (*state, *self.get_catalog_versions()), None
+
+    def get_object_validators(self):
+        """Дата изменения рецепта, его счётчиков и встроенных данных."""
+        pk = self.kwargs['pk']
+        if not pk.isdigit():
+            return None, None
+        count, _, modified = Recipe.objects.filter(pk=pk).change_state()
+        if not count:
+            return None, None
+        versions = self.get_catalog_versions()
+        modified = max(modified, *map(version_date, versions))
+        return (pk, modified, *versions), modified
 
     def action_post_delete(self, pk, serializer_class):
-        """Удаление/редактирование рецептов."""
+        """
+        Добавление/удаление рецепта в избранное или корзину.
+
+        Повторное добавление ловится по ограничению уникальности, удаление
+        выполняется одним запросом, и агрегаты меняются только если
+        строка действительно удалена.
+        """
         user = self.request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        object = serializer_class.Meta.model.objects.filter(
-            user=user, recipe=recipe
-        )
+        model = serializer_class.Meta.model
 
         if self.request.method == 'POST':
+            recipe = get_object_or_404(Recipe, pk=pk)
+            try:
+                with transaction.atomic():
+                    object = model.objects.create(user=user, recipe=recipe)
+            except IntegrityError:
+                raise ValidationError({'error': ['Этот рецепт уже добавлен']})
             serializer = serializer_class(
-                data={'user': user.id, 'recipe': pk},
-                context={'request': self.request}
+                object, context={'request': self.request}
             )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if self.request.method == 'DELETE':
-            if object.exists():
-                object.delete()
+            if remove_user_recipe(model, user.id, pk):
                 return Response(status=status.HTTP_204_NO_CONTENT)
+            if not Recipe.objects.filter(pk=pk).exists():
+                raise Http404
             return Response(
                 {'error': 'Этого рецепта нет в списке'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -101,42 +189,225 @@ class RecipeViewSet(viewsets.ModelViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
         return self.action_post_delete(pk, ShoppingCartSerializer)
 
+    def action_bulk(self, model):
+        """
+        Пакетное добавление/удаление рецептов в избранное или корзину.
+
+        Все id проверяются одним запросом. Список покупок и счётчики
+        рецептов обновляются пакетно и только по строкам, которые этот
+        запрос действительно вставил или удалил. Ответ содержит результат
+        для каждого id.
+        """
+        serializer = RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = self.request.user
+        found = set(
+            Recipe.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if self.request.method == 'POST':
+            changed = add_user_recipes(
+                model, user.id, [pk for pk in ids if pk in found]
+            )
+            done, skipped = 'added', 'exists'
+        else:
+            changed = [recipe_id for _, recipe_id in remove_user_recipes(
+                model.objects.filter(user=user, recipe_id__in=found)
+            )]
+            done, skipped = 'removed', 'absent'
+        changed = set(changed)
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    done if pk in changed
+                    else skipped if pk in found else 'not_found'
+                )
+            }
+            for pk in ids
+        ]})
+
     @action(
-        detail=False, methods=['get'], permission_classes=[IsAuthenticated]
+        methods=['POST', 'DELETE'], detail=False,
+        url_path='favorite', url_name='favorite-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        """Пакетное изменение избранного."""
+        return self.action_bulk(Favorite)
+
+    @action(
+        methods=['POST', 'DELETE'], detail=False,
+        url_path='shopping_cart', url_name='shopping-cart-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_bulk(self, request):
+        """Пакетное изменение корзины покупок."""
+        return self.action_bulk(ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=FileFormatNegotiation
     )
     def download_shopping_cart(self, request):
-        """Скачать корзину покупок."""
-        response = HttpResponse(content_type='application/pdf')
+        """
+        Скачать корзину покупок.
+
+        Формат выбирается параметром format: pdf (по умолчанию), txt, csv.
+        Документ кэшируется по версии списка покупок пользователя.
+        С параметром async=true документ генерирует фоновый воркер,
+        ответ 202 содержит задание для опроса. ETag получает только
+        ответ с самим документом: клиент, не скачавший его, не получит
+        304 по ETag ответа 202.
+        """
+        file_format = request.query_params.get('format', 'pdf')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'format': f'Допустимые форматы: '
+                           f'{", ".join(SHOPPING_LIST_FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        etag = quote_etag(shopping_list_etag(request))
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+        render, content_type = SHOPPING_LIST_FORMATS[file_format]
+        filename = f'shopping_cart.{file_format}'
+        cache_key = shopping_list_cache_key(request.user, file_format)
+        content = cache.get(cache_key)
+        if content is None and request.query_params.get('async') in (
+            '1', 'true'
+        ):
+            return self.start_shopping_list_job(request, file_format)
+        if content is None:
+            file = SpooledTemporaryFile(max_size=SHOPPING_LIST_SPOOL_MAX_SIZE)
+            render(get_shopping_list(request.user).iterator(), file)
+            size = file.tell()
+            file.seek(0)
+            if size > SHOPPING_LIST_CACHE_MAX_SIZE:
+                response = FileResponse(
+                    file,
+                    as_attachment=True,
+                    filename=filename,
+                    content_type=content_type
+                )
+                response['ETag'] = etag
+                return response
+            content = file.read()
+            file.close()
+            cache.set(cache_key, content, SHOPPING_LIST_CACHE_TIMEOUT)
+        response = HttpResponse(content, content_type=content_type)
         response['Content-Disposition'] = (
-            "attachment; filename='shopping_cart.pdf'"
+            f'attachment; filename="{filename}"'
+        )
+        response['ETag'] = etag
+        return response
+
+    def start_shopping_list_job(self, request, file_format):
+        """Ставит генерацию документа в очередь фонового воркера."""
+        user = request.user
+        job, created = ShoppingListJob.objects.get_or_create(
+            user=user,
+            version=user.shopping_cart_version,
+            file_format=file_format
         )
-        p = canvas.Canvas(response)
-        arial = ttfonts.TTFont('Arial', 'data/arial.ttf')
-        pdfmetrics.registerFont(arial)
-        p.setFont('Arial', 14)
-
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user).values_list(
-            'ingredient__name', 'amount', 'ingredient__measurement_unit'
+        if created:
+            ShoppingListJob.objects.filter(user=user).exclude(
+                version=user.shopping_cart_version
+            ).delete()
+        elif job.status == ShoppingListJob.FAILED:
+            job.status = ShoppingListJob.PENDING
+            job.save(update_fields=('status',))
+        serializer = ShoppingListJobSerializer(job)
+        return Response(
+            serializer.data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': request.build_absolute_uri(
+                reverse('shoppinglistjob-detail', args=(job.id,))
+            )}
         )
 
-        ingr_list = {}
-        for name, amount, unit in ingredients:
-            if name not in ingr_list:
-                ingr_list[name] = {'amount': amount, 'unit': unit}
-            else:
-                ingr_list[name]['amount'] += amount
-        height = 700
-
-        p.drawString(100, 750, 'Список покупок')
-        for i, (name, data) in enumerate(ingr_list.items(), start=1):
-            p.drawString(
-                80, height,
-                f"{i}. {name} – {data['amount']} {data['unit']}")
-            height -= 25
-        p.showPage()
-        p.save()
-        return response
+    @action(
+        detail=False, methods=['get'], permission_classes=[IsAuthenticated]
+    )
+    def shopping_list(self, request):
+        """Список покупок в JSON."""
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        serializer = ShoppingListItemSerializer(items, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(
+        detail=False, methods=['get'], permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов из подписок, новые сначала.
+
+        Пагинация по курсору, рецепты страницы читаются одним запросом
+        по id с теми же связями, что и в списке.
+        """
+        paginator = FeedPagination()
+        ids = paginator.paginate_sources(feed_sources(request.user), request)
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def pantry(self, request):
+        """
+        Что приготовить из продуктов в наличии.
+
+        Рецепты ранжируются по обратному индексу ингредиентов: сначала
+        с наибольшей долей имеющихся ингредиентов, затем с меньшим
+        числом недостающих. Страница рецептов читается одним запросом.
+        """
+        serializer = PantrySerializer(data={
+            'ingredients': request.query_params.getlist('ingredients')
+        })
+        serializer.is_valid(raise_exception=True)
+        ranked = get_pantry_index().rank(
+            serializer.validated_data['ingredients']
+        )
+        paginator = LimitPagination()
+        page = paginator.paginate_queryset(ranked, request)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        page = [item for item in page if item[0] in recipes]
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page], many=True
+        )
+        for data, (_, coverage, missing) in zip(serializer.data, page):
+            data['coverage'] = round(coverage, 4)
+            data['missing'] = missing
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], permission_classes=[AllowAny])
+    def similar(self, request, pk=None):
+        """
+        Похожие рецепты по ингредиентам и тегам.
+
+        Списки заранее считает команда similarrecipes, здесь они
+        читаются одним запросом по индексу.
+        """
+        if not pk.isdigit():
+            raise Http404
+        recipes = Recipe.objects.filter(
+            similar_to__recipe_id=pk
+        ).order_by('-similar_to__score', 'id')
+        if not recipes and not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        serializer = ShortRecipeSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(
         detail=True,
@@ -145,9 +416,59 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='get-link'
     )
     def get_short_link(self, request, pk=None):
-        """Возвращает короткую ссылку на рецепт."""
-        protocol = request.scheme
-        domain = request.get_host()
-        surl = get_surl(f'{protocol}://{domain}/recipes/{pk}')
-        short_link = f'{protocol}://{domain}{surl}'
+        """Возвращает короткую ссылку на рецепт без обращения к базе."""
+        if not pk.isdigit():
+            raise Http404
+        short_link = request.build_absolute_uri(
+            reverse('short-link', args=(encode_short_code(int(pk)),))
+        )
         return Response({'short-link': short_link}, status=status.HTTP_200_OK)
+
+
+class ShoppingListJobViewSet(mixins.RetrieveModelMixin,
+                             viewsets.GenericViewSet):
+    """Статус и результат фоновой генерации списка покупок."""
+
+    serializer_class = ShoppingListJobSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        """Задания текущего пользователя."""
+        return ShoppingListJob.objects.filter(
+            user=self.request.user
+        ).defer('content')
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Скачать готовый файл."""
+        job = get_object_or_404(ShoppingListJob, pk=pk, user=request.user)
+        if job.status != ShoppingListJob.DONE:
+            return Response(
+                {'error': 'Файл ещё не готов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type = SHOPPING_LIST_FORMATS[job.file_format][1]
+        response = HttpResponse(bytes(job.content), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{job.file_format}"'
+        )
+        return response
+
+
+def short_link_redirect(request, code):
+    """
+    Переход по короткой ссылке.
+
+    Код рецепта разбирается без базы при попадании в кэш, ответ 301
+    можно кэшировать в nginx. Старые ссылки django_short_url
+    обрабатываются самим пакетом.
+    """
+    try:
+        recipe_id = resolve_short_code(code)
+    except LookupError:
+        return short_url_redirect(request, code)
+    response = HttpResponsePermanentRedirect(
+        request.build_absolute_uri(f'/recipes/{recipe_id}')
+    )
+    patch_cache_control(response, public=True, max_age=SHORT_LINK_MAX_AGE)
+    return response
@@ -107,11 +107,20 @@ USE_L10N = True
 
 USE_TZ = True
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', default='/tmp/foodgram_cache'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
 STATIC_URL = '/foodgram_static/'
 STATIC_ROOT = BASE_DIR / 'collected_static'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media'
+DEFAULT_FILE_STORAGE = 'foodgram_backend.storage.HashedMediaStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -149,3 +158,13 @@ DJOSER = {
 }
 
 DJANGO_SHORT_URL_REDIRECT_URL = ''
+
+SHOPPING_LIST_RENDER_CONCURRENCY = int(
+    os.getenv('SHOPPING_LIST_RENDER_CONCURRENCY', default=2)
+)
+
+RECIPE_COUNTER_SHARDS = int(os.getenv('RECIPE_COUNTER_SHARDS', default=0))
+
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=10000)
+)
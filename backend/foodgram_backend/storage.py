@@ -0,0 +1,48 @@
+"""Хранилище медиа с именами по содержимому."""
+
+import hashlib
+from pathlib import PurePosixPath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from api.constants import IMAGE_VARIANTS_DIR, MEDIA_HASH_LENGTH
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    Файлы называются хэшем содержимого.
+
+    Одинаковые загрузки хранятся один раз, имя файла не меняется
+    вместе с содержимым, поэтому nginx отдаёт их с Cache-Control
+    immutable. Копии картинок в каталогах variants уже названы по
+    хэшу оригинала и сохраняются под своим именем.
+    """
+
+    def save(self, name, content, max_length=None):
+        """Сохранение под хэшем, если такого файла ещё нет."""
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        path = PurePosixPath(name)
+        if path.parent.name == IMAGE_VARIANTS_DIR:
+            return super().save(name, content, max_length)
+        name = str(path.parent / (
+            self.content_hash(content) + path.suffix.lower()
+        ))
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    @staticmethod
+    def content_hash(content):
+        """sha256 содержимого файла."""
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return digest.hexdigest()[:MEDIA_HASH_LENGTH]
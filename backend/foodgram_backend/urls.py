@@ -3,10 +3,12 @@
 from django.contrib import admin
 from django.urls import include, path, re_path
 
+from api.views import short_link_redirect
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     re_path(
-        r'^s/', include('django_short_url.urls', namespace='django_short_url')
+        r'^s/(?P<code>\w+)/?$', short_link_redirect, name='short-link'
     ),
 ]
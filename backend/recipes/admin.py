@@ -1,9 +1,11 @@
 """Настройка админ панеди рецептов."""
 from django.contrib.admin import ModelAdmin, register, TabularInline
 
+from recipes.ingredients import changing_ingredients
 from recipes.models import (
     Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
 )
+from recipes.relations import remove_user_recipes
 
 
 @register(Ingredient)
@@ -27,6 +29,13 @@ class RecipeIngredientInline(TabularInline):
     model = RecipeIngredient
     extra = 0
     min_num = 1
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        """Строки с рецептом и ингредиентом одним запросом."""
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient'
+        )
 
 
 @register(Recipe)
@@ -38,8 +47,11 @@ class RecipeAdmin(ModelAdmin):
         'favorite'
     )
     inlines = [RecipeIngredientInline]
-    list_filter = ('name', 'author', 'tags')
-    search_fields = ('name',)
+    list_filter = ('tags',)
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
     readonly_fields = ('favorite',)
     fields = (
         'image', ('name', 'author'),
@@ -47,14 +59,24 @@ class RecipeAdmin(ModelAdmin):
         'favorite'
     )
 
+    def get_queryset(self, request):
+        """Рецепты с тегами одним дополнительным запросом на страницу."""
+        return super().get_queryset(request).with_counters(
+        ).prefetch_related('tags')
+
+    def save_related(self, request, form, formsets, change):
+        """Ингредиенты из формы с пересчётом списков покупок."""
+        with changing_ingredients((form.instance.pk,)):
+            super().save_related(request, form, formsets, change)
+
     def display_tags(self, obj):
         """Теги."""
         return ', '.join([tag.name for tag in obj.tags.all()])
     display_tags.short_description = 'Теги'
 
     def favorite(self, obj):
-        """Избранное."""
-        return obj.favorite.count()
+        """Избранное с ещё не свёрнутыми шардами."""
+        return getattr(obj, 'favorites_total', obj.favorites_count)
     favorite.short_description = 'Количество раз в избранном'
 
 
@@ -63,17 +85,58 @@ class RecipeIngredientAdmin(ModelAdmin):
     """Рецепт+ингредиент."""
 
     list_display = ('recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        """Сохранение строки, в том числе перенос в другой рецепт."""
+        with changing_ingredients(
+            (form.initial.get('recipe'), obj.recipe_id)
+        ):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        """Удаление строки с пересчётом списков покупок."""
+        with changing_ingredients((obj.recipe_id,)):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        """Удаление выбранных строк с пересчётом списков покупок."""
+        with changing_ingredients(
+            queryset.values_list('recipe_id', flat=True).distinct()
+        ):
+            super().delete_queryset(request, queryset)
+
+
+class UserRecipeAdmin(ModelAdmin):
+    """
+    Избранное или корзина.
+
+    Удаление идёт через recipes.relations: сигналов удаления у этих
+    моделей нет, агрегаты пересчитываются по удалённым строкам.
+    """
+
+    list_display = ('recipe', 'user')
+    list_select_related = ('recipe', 'user')
+    autocomplete_fields = ('recipe', 'user')
+    show_full_result_count = False
+
+    def delete_model(self, request, obj):
+        """Удаление строки с пересчётом агрегатов."""
+        remove_user_recipes(type(obj).objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        """Удаление выбранных строк с пересчётом агрегатов."""
+        remove_user_recipes(queryset)
 
 
 @register(Favorite)
-class FavoriteAdmin(ModelAdmin):
+class FavoriteAdmin(UserRecipeAdmin):
     """Избранное."""
 
-    list_display = ('recipe', 'user')
-
 
 @register(ShoppingCart)
-class ShoppingCartAdmin(ModelAdmin):
+class ShoppingCartAdmin(UserRecipeAdmin):
     """Корзина покупок."""
-
-    list_display = ('recipe', 'user')
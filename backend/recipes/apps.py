@@ -8,3 +8,7 @@ class RecipesConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        """Подключение сигналов."""
+        from recipes import signals  # noqa: F401
@@ -0,0 +1,157 @@
+"""Денормализованные счётчики рецептов и пользователей."""
+
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from recipes.models import (Favorite, Recipe, RecipeCounterShard,
+                            ShoppingCart)
+from users.models import Follow, User
+
+RECIPE_COUNTERS = {
+    RecipeCounterShard.FAVORITES: Favorite,
+    RecipeCounterShard.SHOPPING_CARTS: ShoppingCart,
+}
+USER_COUNTERS = {
+    'recipes_count': (Recipe, 'author'),
+    'followers_count': (Follow, 'author'),
+}
+
+
+def increment(queryset, field, delta, **values):
+    """Изменяет колонку-счётчик одним UPDATE, не опуская ниже нуля."""
+    return queryset.update(
+        **{field: Greatest(F(field) + delta, Value(0))}, **values
+    )
+
+
+def add_to_shard(recipe_id, counter, delta):
+    """Прибавляет delta к случайному шарду счётчика рецепта."""
+    shard = random.randrange(settings.RECIPE_COUNTER_SHARDS)
+    shards = RecipeCounterShard.objects.filter(
+        recipe_id=recipe_id, counter=counter, shard=shard
+    )
+    if shards.update(value=F('value') + delta, modified=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            RecipeCounterShard.objects.create(
+                recipe_id=recipe_id, counter=counter, shard=shard,
+                value=delta
+            )
+    except IntegrityError:
+        shards.update(value=F('value') + delta, modified=timezone.now())
+
+
+def change_recipe_counter(recipe_ids, counter, delta):
+    """Изменяет счётчик рецептов: в колонке или в шардах."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if not settings.RECIPE_COUNTER_SHARDS:
+        increment(
+            Recipe.objects.filter(pk__in=recipe_ids),
+            f'{counter}_count', delta, counters_modified=timezone.now()
+        )
+        return
+    for recipe_id in recipe_ids:
+        add_to_shard(recipe_id, counter, delta)
+
+
+def change_user_counter(user_ids, field, delta):
+    """Изменяет счётчик пользователей."""
+    user_ids = list(user_ids)
+    if user_ids:
+        increment(User.objects.filter(pk__in=user_ids), field, delta)
+
+
+def fold_shards():
+    """Переносит значения шардов в колонки рецептов, возвращает их число."""
+    folded = 0
+    for counter in RECIPE_COUNTERS:
+        field = f'{counter}_count'
+        recipe_ids = RecipeCounterShard.objects.filter(
+            counter=counter
+        ).values_list('recipe_id', flat=True).distinct()
+        for recipe_id in list(recipe_ids):
+            with transaction.atomic():
+                shards = list(RecipeCounterShard.objects.select_for_update(
+                ).filter(recipe_id=recipe_id, counter=counter))
+                total = sum(shard.value for shard in shards)
+                increment(
+                    Recipe.objects.filter(pk=recipe_id), field, total,
+                    counters_modified=timezone.now()
+                )
+                RecipeCounterShard.objects.filter(
+                    pk__in=[shard.pk for shard in shards]
+                ).delete()
+            folded += len(shards)
+    return folded
+
+
+def actual_count(model, field):
+    """Подзапрос с числом строк model, ссылающихся на запись."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+@transaction.atomic
+def recount_recipes(recipe_ids):
+    """
+    Счётчики рецептов заново по связанным таблицам.
+
+    Повторный вызов ничего не меняет, поэтому подходит для каскадных
+    удалений, где число удалённых строк неизвестно.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    RecipeCounterShard.objects.filter(recipe_id__in=recipe_ids).delete()
+    Recipe.objects.filter(pk__in=recipe_ids).update(**{
+        f'{counter}_count': actual_count(model, 'recipe')
+        for counter, model in RECIPE_COUNTERS.items()
+    }, counters_modified=timezone.now())
+
+
+def recount_users(user_ids):
+    """Счётчики пользователей заново по связанным таблицам."""
+    user_ids = list(user_ids)
+    if user_ids:
+        User.objects.filter(pk__in=user_ids).update(**{
+            field: actual_count(model, relation)
+            for field, (model, relation) in USER_COUNTERS.items()
+        })
+
+
+def reconcile():
+    """
+    Пересчитывает счётчики по связанным таблицам.
+
+    Шарды сначала сворачиваются, поэтому расхождение с колонками
+    означает пропущенное изменение. Возвращает число исправленных
+    значений по каждому счётчику.
+    """
+    fold_shards()
+    fixed = {}
+    for counter, model in RECIPE_COUNTERS.items():
+        field = f'{counter}_count'
+        fixed[field] = Recipe.objects.annotate(
+            actual=actual_count(model, 'recipe')
+        ).exclude(**{field: F('actual')}).update(
+            **{field: actual_count(model, 'recipe')},
+            counters_modified=timezone.now()
+        )
+    for field, (model, relation) in USER_COUNTERS.items():
+        fixed[field] = User.objects.annotate(
+            actual=actual_count(model, relation)
+        ).exclude(**{field: F('actual')}).update(
+            **{field: actual_count(model, relation)}
+        )
+    return fixed
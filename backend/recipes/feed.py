@@ -0,0 +1,135 @@
+"""Лента рецептов авторов, на которых подписан пользователь."""
+
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import F
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Follow, User
+
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_SIZE = 100
+
+
+def fans_out(author_ids):
+    """Авторы, чьи рецепты раскладываются по лентам при записи."""
+    return User.objects.filter(
+        pk__in=author_ids,
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('pk', flat=True)
+
+
+def fan_out(recipes):
+    """
+    Раскладывает новые рецепты по лентам подписчиков авторов.
+
+    Записи вставляются пачками по FEED_FANOUT_BATCH_SIZE. Рецепты
+    авторов с большим числом подписчиков не раскладываются: лента
+    читает их напрямую, а сами рецепты помечаются fan_out_pending и
+    раскладываются в catch_up, когда подписчиков станет меньше.
+    """
+    recipes = list(recipes)
+    authors = set(fans_out({recipe.author_id for recipe in recipes}))
+    by_author = {}
+    pending = []
+    for recipe in recipes:
+        if recipe.author_id in authors:
+            by_author.setdefault(recipe.author_id, []).append(recipe)
+        else:
+            pending.append(recipe.id)
+    if pending:
+        Recipe.objects.filter(pk__in=pending).update(fan_out_pending=True)
+    if not by_author:
+        return
+    followers = Follow.objects.filter(author__in=by_author).values_list(
+        'user_id', 'author_id'
+    ).order_by().iterator(chunk_size=FEED_FANOUT_BATCH_SIZE)
+    entries = (
+        TimelineEntry(
+            user_id=user_id, recipe_id=recipe.id, author_id=author_id,
+            pub_date=recipe.pub_date
+        )
+        for user_id, author_id in followers
+        for recipe in by_author[author_id]
+    )
+    while True:
+        batch = list(islice(entries, FEED_FANOUT_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """
+    Последние рецепты автора в ленту нового подписчика.
+
+    Записи создаются и для авторов, которых лента читает напрямую:
+    если подписчиков станет меньше порога, лента подписчика уже
+    заполнена, а повторы при чтении отбрасываются.
+    """
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date'
+    ).values_list('id', 'pub_date')[:FEED_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                pub_date=pub_date
+            )
+            for recipe_id, pub_date in recipes
+        ),
+        ignore_conflicts=True
+    )
+
+
+def catch_up(author_ids):
+    """
+    Раскладывает рецепты, опубликованные, пока авторы были выше порога.
+
+    Вызывается после уменьшения числа подписчиков. Раскладываются
+    последние FEED_BACKFILL_SIZE рецептов каждого автора, снова
+    раскладывающего рецепты при записи, пометка снимается со всех.
+    """
+    pending = Recipe.objects.filter(
+        author_id__in=fans_out(author_ids), fan_out_pending=True
+    )
+    recipes = []
+    for author_id in pending.order_by().values_list(
+        'author_id', flat=True
+    ).distinct():
+        recipes.extend(pending.filter(author_id=author_id).order_by(
+            '-pub_date'
+        ).only('id', 'author_id', 'pub_date')[:FEED_BACKFILL_SIZE])
+    if not recipes:
+        return
+    fan_out(recipes)
+    pending.update(fan_out_pending=False)
+
+
+def refresh(recipe):
+    """Дата рецепта в лентах после его изменения."""
+    TimelineEntry.objects.filter(recipe=recipe).update(
+        pub_date=recipe.pub_date
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает рецепты автора из ленты отписавшегося."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def feed_sources(user):
+    """
+    Источники ленты с полями pub_date и recipe_id.
+
+    Разложенные записи из TimelineEntry и рецепты авторов с большим
+    числом подписчиков, которые читаются при запросе ленты.
+    """
+    return (
+        TimelineEntry.objects.filter(user=user),
+        Recipe.objects.filter(
+            author__following__user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).annotate(recipe_id=F('id')),
+    )
@@ -0,0 +1,111 @@
+"""Картинки: ограничение размера оригинала и уменьшенные копии."""
+
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from api.constants import (IMAGE_MAX_SIZE, IMAGE_VARIANT_FORMAT,
+                           IMAGE_VARIANT_QUALITY, IMAGE_VARIANTS_DIR)
+
+EXIF_ORIENTATION = 0x0112
+
+
+def cap_image(file):
+    """
+    Оригинал не больше IMAGE_MAX_SIZE по большей стороне.
+
+    Поворот из EXIF применяется к пикселям. Анимированные картинки,
+    а также картинки без поворота в пределах размера возвращаются
+    без перекодирования.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    image_format = image.format
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    if getattr(image, 'is_animated', False) or (
+        orientation == 1 and max(image.size) <= IMAGE_MAX_SIZE
+    ):
+        file.seek(0)
+        return file
+    transposed = ImageOps.exif_transpose(image)
+    transposed.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE))
+    buffer = BytesIO()
+    transposed.save(buffer, format=image_format)
+    return ContentFile(buffer.getvalue(), name=file.name)
+
+
+def variant_name(name, variant, size):
+    """Путь уменьшенной копии в хранилище."""
+    path = PurePosixPath(name)
+    width, height = size
+    return str(path.parent / IMAGE_VARIANTS_DIR / (
+        f'{path.stem}_{variant}_{width}x{height}.'
+        f'{IMAGE_VARIANT_FORMAT.lower()}'
+    ))
+
+
+def variants_field(field_file):
+    """Поле модели со списком созданных копий картинки."""
+    return f'{field_file.field.name}_variants'
+
+
+def make_variants(field_file, variants, force=False):
+    """
+    Создаёт недостающие копии картинки.
+
+    Возвращает число созданных копий и отсортированный список всех
+    имеющихся вариантов: его сохраняют в поле модели, чтобы ссылки
+    строились без обращений к хранилищу.
+    """
+    storage = field_file.storage
+    missing = {
+        variant: size for variant, size in variants.items()
+        if force or not storage.exists(
+            variant_name(field_file.name, variant, size)
+        )
+    }
+    if not missing:
+        return 0, sorted(variants)
+    with storage.open(field_file.name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info or 'A' in image.mode
+            else 'RGB'
+        )
+    for variant, size in missing.items():
+        name = variant_name(field_file.name, variant, size)
+        copy = image.copy()
+        copy.thumbnail(size, Image.LANCZOS)
+        buffer = BytesIO()
+        copy.save(
+            buffer, format=IMAGE_VARIANT_FORMAT,
+            quality=IMAGE_VARIANT_QUALITY, method=6
+        )
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, ContentFile(buffer.getvalue()))
+    return len(missing), sorted(variants)
+
+
+def variant_urls(field_file, variants, request=None):
+    """
+    Ссылки на копии картинки по названиям вариантов.
+
+    Какие копии созданы, берётся из поля модели, заполненного после
+    make_variants; для остальных None. Хранилище не опрашивается.
+    """
+    available = getattr(field_file.instance, variants_field(field_file), ())
+    urls = {}
+    for variant, size in variants.items():
+        if variant not in available:
+            urls[variant] = None
+            continue
+        url = field_file.storage.url(
+            variant_name(field_file.name, variant, size)
+        )
+        urls[variant] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -0,0 +1,35 @@
+"""Изменение ингредиентов рецептов с пересчётом производных данных."""
+
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from recipes.models import Recipe, ShoppingCart, ShoppingListItem
+from recipes.pantry import update_pantry_index
+
+
+@contextmanager
+def changing_ingredients(recipe_ids):
+    """
+    Блок, внутри которого меняются строки RecipeIngredient рецептов.
+
+    До изменений вклад рецептов вычитается из списков покупок
+    пользователей, у которых они в корзине, после — добавляется по
+    новым строкам, версия корзины растёт, индекс продуктов обновляется,
+    рецепты ставятся в очередь пересчёта похожих. Через этот блок пишут
+    и API, и админка.
+    """
+    with transaction.atomic():
+        recipe_ids = {recipe_id for recipe_id in recipe_ids if recipe_id}
+        cart_user_ids = {}
+        for recipe_id, user_id in ShoppingCart.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'user_id'):
+            cart_user_ids.setdefault(recipe_id, []).append(user_id)
+        for recipe_id, user_ids in cart_user_ids.items():
+            ShoppingListItem.objects.remove_recipe(recipe_id, user_ids)
+        yield
+        for recipe_id, user_ids in cart_user_ids.items():
+            ShoppingListItem.objects.add_recipe(recipe_id, user_ids)
+        update_pantry_index(recipe_ids)
+        Recipe.objects.filter(pk__in=recipe_ids).mark_similar_stale()
@@ -0,0 +1,80 @@
+"""Удаление файлов медиа без ссылок."""
+
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes.images import variant_name
+from recipes.signals import IMAGE_FIELDS
+
+MIN_AGE_HOURS = 24
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища с подкаталогами."""
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from walk(storage, f'{directory}/{name}')
+
+
+class Command(BaseCommand):
+    """
+    Сборка мусора в медиа.
+
+    Удаляет из каталогов upload_to файлы, на которые не ссылаются
+    Recipe.image и User.avatar, вместе с их копиями. Свежие файлы не
+    трогаются: их запись в базу может быть ещё не завершена.
+    """
+
+    help = 'Удаляет файлы медиа, на которые не ссылаются рецепты и аватары.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--min-age', type=float, default=MIN_AGE_HOURS,
+            help='Не удалять файлы моложе стольких часов.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы для удаления.'
+        )
+
+    def handle(self, *args, **options):
+        """Поиск и удаление файлов без ссылок."""
+        storage = default_storage
+        threshold = timezone.now() - timedelta(hours=options['min_age'])
+        referenced = set()
+        directories = set()
+        for model, (field_name, variants) in IMAGE_FIELDS.items():
+            field = model._meta.get_field(field_name)
+            directories.add(field.upload_to.rstrip('/'))
+            names = set(model.objects.exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list(field_name, flat=True).distinct().iterator())
+            if field.has_default():
+                names.add(field.get_default())
+            for name in names:
+                referenced.add(name)
+                referenced.update(
+                    variant_name(name, variant, size)
+                    for variant, size in variants.items()
+                )
+        removed = 0
+        for directory in sorted(directories):
+            if not storage.exists(directory):
+                continue
+            for name in walk(storage, directory):
+                if name in referenced or (
+                    storage.get_modified_time(name) > threshold
+                ):
+                    continue
+                removed += 1
+                self.stdout.write(name)
+                if not options['dry_run']:
+                    storage.delete(name)
+        action = 'К удалению' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{action} файлов: {removed}.'))
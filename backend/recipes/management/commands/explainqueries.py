@@ -0,0 +1,202 @@
+"""Проверка планов запросов API."""
+
+import re
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.filters import IngredientFilter, RecipeFilter
+from api.paginations import PAGE_SIZE
+from api.utils import get_shopping_list
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User
+
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?([a-z_][a-z0-9_]*)(?!.*USING)'),
+}
+SMALL_TABLES = ('recipes_tag',)
+
+
+def api_request(user, **params):
+    """Запрос DRF для фильтров."""
+    request = Request(RequestFactory().get('/', params))
+    request.user = user
+    return request
+
+
+def recipe_filter(user, **params):
+    """Рецепты после RecipeFilter, как в RecipeViewSet.list."""
+    return RecipeFilter(
+        params, Recipe.objects.for_read(user),
+        request=api_request(user, **params)
+    ).qs
+
+
+ENDPOINT_QUERIES = (
+    (
+        'GET /recipes/',
+        lambda sample: Recipe.objects.for_read(sample['user'])[:PAGE_SIZE],
+    ),
+    (
+        'GET /recipes/ (count)',
+        lambda sample: recipe_filter(sample['user']).values('id'),
+    ),
+    (
+        'GET /recipes/?author=',
+        lambda sample: recipe_filter(
+            sample['user'], author=sample['author']
+        )[:PAGE_SIZE],
+    ),
+    (
+        'GET /recipes/?tags=',
+        lambda sample: recipe_filter(
+            sample['user'], tags=sample['tag']
+        )[:PAGE_SIZE],
+    ),
+    (
+        'GET /recipes/?tags=&tags_mode=all',
+        lambda sample: recipe_filter(
+            sample['user'], tags=sample['tag'], tags_mode='all'
+        )[:PAGE_SIZE],
+    ),
+    (
+        'GET /recipes/?is_favorited=1',
+        lambda sample: recipe_filter(
+            sample['user'], is_favorited='1'
+        )[:PAGE_SIZE],
+    ),
+    (
+        'GET /recipes/?is_in_shopping_cart=1',
+        lambda sample: recipe_filter(
+            sample['user'], is_in_shopping_cart='1'
+        )[:PAGE_SIZE],
+    ),
+    (
+        'GET /recipes/{id}/',
+        lambda sample: Recipe.objects.for_read(sample['user']).filter(
+            pk=sample['recipe']
+        ),
+    ),
+    (
+        'POST /recipes/{id}/favorite/',
+        lambda sample: Favorite.objects.filter(
+            user=sample['user'], recipe=sample['recipe']
+        ),
+    ),
+    (
+        'POST /recipes/{id}/shopping_cart/',
+        lambda sample: ShoppingCart.objects.filter(
+            user=sample['user'], recipe=sample['recipe']
+        ),
+    ),
+    (
+        'GET /recipes/download_shopping_cart/',
+        lambda sample: get_shopping_list(sample['user']),
+    ),
+    (
+        'GET /ingredients/?name=',
+        lambda sample: IngredientFilter(
+            {'name': sample['ingredient']}, Ingredient.objects.all()
+        ).qs,
+    ),
+    (
+        'GET /users/subscriptions/',
+        lambda sample: User.objects.subscriptions(
+            sample['user']
+        )[:PAGE_SIZE],
+    ),
+    (
+        'GET /users/subscriptions/ (recipes)',
+        lambda sample: Recipe.objects.limited_per_author(3).filter(
+            author__following__user=sample['user']
+        ),
+    ),
+)
+
+
+class Command(BaseCommand):
+    """EXPLAIN для запросов эндпоинтов API с поиском полных сканирований."""
+
+    help = (
+        'Выполняет EXPLAIN для запросов API и сообщает о последовательных '
+        'сканированиях таблиц.'
+    )
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE (только PostgreSQL).'
+        )
+        parser.add_argument(
+            '--force-index', action='store_true',
+            help=(
+                'Запретить планировщику seq scan (только PostgreSQL): '
+                'оставшиеся сканирования означают, что индекса нет.'
+            )
+        )
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя, от имени которого строятся запросы.'
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы целиком.'
+        )
+
+    def handle(self, *args, **options):
+        """Проверка всех запросов из реестра."""
+        vendor = connection.vendor
+        pattern = SEQ_SCAN_PATTERNS.get(vendor)
+        if pattern is None:
+            raise CommandError(f'База {vendor} не поддерживается.')
+        postgresql = vendor == 'postgresql'
+        explain_options = {}
+        if options['analyze'] and postgresql:
+            explain_options = {'analyze': True, 'buffers': True}
+        sample = self.get_sample(options['user'])
+        flagged = []
+        with transaction.atomic():
+            if options['force_index'] and postgresql:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, build in ENDPOINT_QUERIES:
+                plan = build(sample).explain(**explain_options)
+                tables = sorted({
+                    table for table in pattern.findall(plan)
+                    if table not in SMALL_TABLES
+                })
+                if tables:
+                    flagged.append(name)
+                    self.stdout.write(self.style.WARNING(
+                        f'{name}: seq scan {", ".join(tables)}'
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+                if options['verbose_plans'] or tables:
+                    self.stdout.write(plan)
+        if flagged:
+            raise CommandError(
+                f'Последовательные сканирования в {len(flagged)} запросах.'
+            )
+
+    def get_sample(self, user_id):
+        """Значения параметров для построения запросов."""
+        users = User.objects.order_by('id')
+        if user_id is not None:
+            users = users.filter(pk=user_id)
+        user = users.first()
+        if user is None:
+            raise CommandError('Нет пользователя для построения запросов.')
+        recipe = Recipe.objects.order_by('id').first()
+        tag = Tag.objects.order_by('id').first()
+        return {
+            'user': user,
+            'author': recipe.author_id if recipe else 0,
+            'recipe': recipe.id if recipe else 0,
+            'tag': tag.slug if tag else '',
+            'ingredient': 'мук',
+        }
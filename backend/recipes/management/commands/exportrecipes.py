@@ -0,0 +1,90 @@
+"""Выгрузка рецептов в JSON Lines."""
+
+import json
+import sys
+
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe
+
+BATCH_SIZE = 500
+
+
+def recipe_record(recipe):
+    """Рецепт в виде словаря для одной строки JSONL."""
+    return {
+        'author': recipe.author.username,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipe_ingredient.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    """
+    Экспорт рецептов построчно в JSON Lines.
+
+    Рецепты читаются пачками по id, теги и ингредиенты подгружаются
+    одним запросом на пачку. Картинки не копируются, в файл попадает
+    путь в хранилище медиа.
+    """
+
+    help = 'Выгружает рецепты в файл JSON Lines.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько рецептов читать за один запрос.'
+        )
+        parser.add_argument(
+            '--author', action='append', default=[],
+            help='Выгрузить рецепты только этого автора (username).'
+        )
+
+    def handle(self, *args, **options):
+        """Выгрузка рецептов."""
+        if options['path'] == '-':
+            total = self.export(sys.stdout, options)
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                total = self.export(file, options)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {total}.'
+        ))
+
+    def export(self, file, options):
+        """Запись рецептов пачками."""
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            'tags', 'recipe_ingredient__ingredient'
+        ).order_by('id')
+        if options['author']:
+            recipes = recipes.filter(author__username__in=options['author'])
+        total = last_id = 0
+        while True:
+            batch = list(recipes.filter(id__gt=last_id)[
+                :options['batch_size']
+            ])
+            if not batch:
+                return total
+            for recipe in batch:
+                file.write(json.dumps(
+                    recipe_record(recipe), ensure_ascii=False
+                ) + '\n')
+            total += len(batch)
+            last_id = batch[-1].id
+            self.stderr.write(f'Выгружено {total}')
@@ -0,0 +1,53 @@
+"""Создание уменьшенных копий картинок."""
+
+from django.core.management import BaseCommand
+
+from recipes.images import make_variants, variants_field
+from recipes.signals import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    """
+    Копии картинок рецептов и аватаров.
+
+    Нужна для картинок, загруженных до появления копий или через
+    importrecipes, где сигналы не срабатывают. Созданные варианты
+    записываются в поля моделей, по которым строятся ссылки.
+    """
+
+    help = 'Создаёт недостающие уменьшенные копии картинок.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать все копии.'
+        )
+
+    def handle(self, *args, **options):
+        """Обход картинок всех моделей."""
+        for model, (field, variants) in IMAGE_FIELDS.items():
+            names = model.objects.exclude(**{field: ''}).exclude(
+                **{f'{field}__isnull': True}
+            ).order_by().values_list(field, flat=True).distinct()
+            created = failed = 0
+            for name in names.iterator():
+                field_file = model._meta.get_field(field).attr_class(
+                    None, model._meta.get_field(field), name
+                )
+                try:
+                    count, available = make_variants(
+                        field_file, variants, options['force']
+                    )
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(self.style.WARNING(f'{name}: {error}'))
+                    continue
+                created += count
+                model.objects.filter(**{field: name}).update(
+                    **{variants_field(field_file): available}
+                )
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: создано копий '
+                f'{created}, ошибок {failed}.'
+            ))
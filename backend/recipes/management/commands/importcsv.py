@@ -1,11 +1,17 @@
 """Загрузка информации."""
 
 import csv
+import json
+from itertools import islice
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.conditional import bump_catalog_version
 from foodgram_backend import settings
-from recipes.models import Ingredient, Tag
+from recipes.models import Ingredient, Tag, normalize_search_name
 
 MODELS_FILES = {
     Ingredient: 'ingredients.csv',
@@ -13,34 +19,225 @@ MODELS_FILES = {
 }
 
 TABLE_COLUMN = {
-    'ingredients.csv': ['name', 'measurement_unit'],
-    'tags.csv': ['name', 'slug'],
+    'ingredients': ['name', 'measurement_unit'],
+    'tags': ['name', 'slug'],
 }
 
+MODELS = {
+    'ingredients': Ingredient,
+    'tags': Tag,
+}
+
+UNIQUE_FIELDS = {
+    Ingredient: ('name', 'measurement_unit'),
+    Tag: ('slug',),
+}
+
+BATCH_SIZE = 1000
+JSON_CHUNK_SIZE = 64 * 1024
+COPY_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+
+def iter_json_array(file):
+    """Потоковое чтение объектов из JSON-массива."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started:
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив объектов.')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON.')
+                break
+            yield item
+        buffer = buffer[position:]
+        if not chunk:
+            if buffer.strip():
+                raise CommandError('Некорректный JSON.')
+            return
+
+
+def prepare(model, columns, row):
+    """Строка файла с вычисляемыми полями модели."""
+    row = {field: row[field].strip() for field in columns}
+    if model is Ingredient:
+        row['search_name'] = normalize_search_name(row['name'])
+    return row
+
 
 class Command(BaseCommand):
-    """Импорт файлов csv."""
+    """
+    Импорт ингредиентов и тегов из csv и json.
 
-    def handle(self, *args, **options):
-        """Загрузка рецептов, тегов."""
-        for model, file in MODELS_FILES.items():
-            all_count = model.objects.count()
-            reader = csv.DictReader(
-                open(
-                    f'{settings.BASE_DIR}/data/{file}', 'r', encoding='utf-8'
-                ), fieldnames=TABLE_COLUMN[file]
+    Файлы читаются потоково, строки вставляются пачками; повторный
+    запуск пропускает уже загруженные записи. На PostgreSQL данные
+    загружаются через COPY FROM STDIN.
+    """
+
+    help = 'Загружает ингредиенты и теги из csv/json файлов.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            'paths', nargs='*',
+            help=(
+                'Файлы ingredients.csv/json, tags.csv/json. '
+                'По умолчанию data/ingredients.csv и data/tags.csv.'
             )
-            model.objects.bulk_create(model(**data) for data in reader)
+        )
+        parser.add_argument(
+            '--model', choices=MODELS,
+            help='Модель для всех файлов вместо определения по имени.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Размер пачки при вставке через ORM.'
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY на PostgreSQL.'
+        )
 
-            if model.objects.count() > all_count:
-                self.stdout.write(
-                    self.style.SUCCESS(f'Загрузка данных {file} завершена!')
+    def handle(self, *args, **options):
+        """Загрузка ингредиентов, тегов."""
+        paths = options['paths'] or [
+            settings.BASE_DIR / 'data' / file
+            for file in MODELS_FILES.values()
+        ]
+        use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        for path in map(Path, paths):
+            name = options['model'] or path.stem
+            model = MODELS.get(name)
+            if model is None:
+                raise CommandError(
+                    f'Не удалось определить модель для {path}, '
+                    f'укажите --model.'
                 )
-            else:
-                self.stdout.write(
-                    self.style.ERROR(f'Ошибка при загрузке {file}!')
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                rows = (
+                    prepare(model, TABLE_COLUMN[name], row)
+                    for row in self.read(path, file, TABLE_COLUMN[name])
                 )
+                if use_copy:
+                    inserted, skipped = self.copy(model, rows)
+                else:
+                    inserted, skipped = self.insert(
+                        model, rows, options['batch_size']
+                    )
+            bump_catalog_version(model)
+            self.stdout.write(self.style.SUCCESS(
+                f'Загрузка данных {path.name} завершена: '
+                f'добавлено {inserted}, пропущено {skipped}.'
+            ))
 
         self.stdout.write(self.style.SUCCESS(
             '=== Ингредиенты и теги успешно загружены ===')
         )
+
+    def read(self, path, file, columns):
+        """Строки файла в виде словарей."""
+        if path.suffix == '.json':
+            return iter_json_array(file)
+        return csv.DictReader(file, fieldnames=columns)
+
+    @staticmethod
+    def existing(model, keys):
+        """Ключи из keys, уже записанные в таблицу."""
+        fields = UNIQUE_FIELDS[model]
+        return keys & set(model.objects.filter(**{
+            f'{fields[0]}__in': {key[0] for key in keys}
+        }).values_list(*fields))
+
+    def insert(self, model, rows, batch_size):
+        """
+        Вставка пачками через ORM.
+
+        Добавленными считаются ключи пачки, которых не было до вставки и
+        которые появились после: строки, отброшенные ignore_conflicts,
+        попадают в пропущенные.
+        """
+        fields = UNIQUE_FIELDS[model]
+        inserted = skipped = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return inserted, skipped
+            unique = {}
+            for row in batch:
+                unique.setdefault(tuple(row[field] for field in fields), row)
+            existing = self.existing(model, unique.keys())
+            model.objects.bulk_create(
+                (
+                    model(**row) for key, row in unique.items()
+                    if key not in existing
+                ),
+                ignore_conflicts=True
+            )
+            added = len(self.existing(model, unique.keys()) - existing)
+            inserted += added
+            skipped += len(batch) - added
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: обработано '
+                f'{inserted + skipped}, добавлено {inserted}'
+            )
+
+    def copy(self, model, rows):
+        """Загрузка через COPY во временную таблицу и INSERT ON CONFLICT."""
+        table = model._meta.db_table
+        total = 0
+        columns = None
+        with SpooledTemporaryFile(
+            max_size=COPY_SPOOL_MAX_SIZE, mode='w+',
+            encoding='utf-8', newline=''
+        ) as spool:
+            writer = csv.writer(spool)
+            for row in rows:
+                if columns is None:
+                    columns = ', '.join(
+                        connection.ops.quote_name(column) for column in row
+                    )
+                writer.writerow(row.values())
+                total += 1
+            if not total:
+                return 0, 0
+            spool.seek(0)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE TEMP TABLE import_rows '
+                    f'(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP'
+                )
+                cursor.copy_expert(
+                    f'COPY import_rows ({columns}) '
+                    f'FROM STDIN WITH (FORMAT csv)',
+                    spool
+                )
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: '
+                    f'скопировано {total}'
+                )
+                cursor.execute(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'SELECT {columns} FROM import_rows '
+                    f'ON CONFLICT DO NOTHING'
+                )
+                inserted = cursor.rowcount
+        return inserted, total - inserted
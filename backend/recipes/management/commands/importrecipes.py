@@ -0,0 +1,167 @@
+"""Загрузка рецептов из JSON Lines."""
+
+import json
+import sys
+from collections import Counter
+from itertools import islice
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from api.constants import MAX_LEN_NAME_RECIPE
+from recipes.counters import change_user_counter
+from recipes.feed import fan_out
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.pantry import update_pantry_index
+from users.models import User
+
+BATCH_SIZE = 500
+
+
+class RecordError(ValueError):
+    """Строка файла не может быть загружена."""
+
+
+class Command(BaseCommand):
+    """
+    Импорт рецептов из файла exportrecipes.
+
+    Строки читаются потоково и загружаются пачками: в одной транзакции
+    bulk_create для рецептов, связей с тегами и ингредиентов, счётчики
+    рецептов авторов обновляются одним UPDATE на автора, рецепты
+    раскладываются по лентам подписчиков пачками. Авторы,
+    теги и ингредиенты должны уже существовать, картинки переносятся
+    в хранилище медиа отдельно.
+    """
+
+    help = 'Загружает рецепты из файла JSON Lines.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл JSON Lines, по умолчанию stdin.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько рецептов загружать в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        """Загрузка рецептов."""
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        if options['path'] == '-':
+            inserted, skipped = self.load(sys.stdin, options['batch_size'])
+        else:
+            with open(options['path'], 'r', encoding='utf-8') as file:
+                inserted, skipped = self.load(file, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {inserted}, пропущено: {skipped}.'
+        ))
+
+    def load(self, file, batch_size):
+        """Загрузка файла пачками."""
+        lines = enumerate(file, start=1)
+        inserted = skipped = 0
+        while True:
+            batch = list(islice(lines, batch_size))
+            if not batch:
+                return inserted, skipped
+            records = []
+            for number, line in batch:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as error:
+                    record = RecordError(str(error))
+                records.append((number, record))
+            authors = dict(User.objects.filter(username__in={
+                record.get('author') for _, record in records
+                if isinstance(record, dict)
+            }).values_list('username', 'id'))
+            valid = []
+            for number, record in records:
+                try:
+                    if isinstance(record, RecordError):
+                        raise record
+                    valid.append(self.parse(record, authors))
+                except RecordError as error:
+                    skipped += 1
+                    self.stderr.write(self.style.WARNING(
+                        f'Строка {number}: {error}'
+                    ))
+            self.save(valid)
+            inserted += len(valid)
+            self.stdout.write(f'Загружено {inserted}, пропущено {skipped}')
+
+    def parse(self, record, authors):
+        """Рецепт, id тегов и ингредиенты из строки файла."""
+        if not isinstance(record, dict):
+            raise RecordError('ожидается объект.')
+        try:
+            author_id = authors.get(record['author'])
+            if author_id is None:
+                raise RecordError(f'нет автора {record["author"]}.')
+            name = str(record['name'])
+            text = str(record['text'])
+            cooking_time = int(record['cooking_time'])
+            image = str(record['image'])
+            tags = [self.tags[slug] for slug in record['tags']]
+            ingredients = {}
+            for item in record['ingredients']:
+                key = (item['name'], item['measurement_unit'])
+                if key not in self.ingredients:
+                    raise RecordError(f'нет ингредиента {key[0]}.')
+                ingredients[self.ingredients[key]] = int(item['amount'])
+        except KeyError as error:
+            raise RecordError(f'нет значения {error}.')
+        except (TypeError, ValueError) as error:
+            raise RecordError(str(error))
+        if not name or len(name) > MAX_LEN_NAME_RECIPE or not text:
+            raise RecordError('некорректное название или описание.')
+        if cooking_time < 1 or not tags or not ingredients:
+            raise RecordError('некорректное время, теги или ингредиенты.')
+        if len(ingredients) != len(record['ingredients']):
+            raise RecordError('ингредиенты повторяются.')
+        if min(ingredients.values()) < 1:
+            raise RecordError('количество должно быть больше нуля.')
+        recipe = Recipe(
+            author_id=author_id, name=name, text=text,
+            cooking_time=cooking_time, image=image
+        )
+        return recipe, set(tags), ingredients
+
+    @transaction.atomic
+    def save(self, valid):
+        """Запись пачки рецептов со связями."""
+        recipes = [recipe for recipe, _, _ in valid]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            authors = Counter(recipe.author_id for recipe in recipes)
+            for author_id, count in authors.items():
+                change_user_counter((author_id,), 'recipes_count', count)
+            Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ).update_search_vector()
+            fan_out(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, tags, _ in valid for tag_id in tags
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe.id, ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for recipe, _, ingredients in valid
+            for ingredient_id, amount in ingredients.items()
+        )
+        update_pantry_index(recipe.id for recipe in recipes)
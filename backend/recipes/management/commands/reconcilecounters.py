@@ -0,0 +1,35 @@
+"""Сверка денормализованных счётчиков."""
+
+from django.core.management import BaseCommand
+
+from recipes.counters import fold_shards, reconcile
+
+
+class Command(BaseCommand):
+    """
+    Сверка счётчиков рецептов и пользователей.
+
+    С --fold только сворачивает шарды счётчиков в колонки рецептов,
+    это безопасно запускать по расписанию. Без флага ещё и
+    пересчитывает все счётчики по связанным таблицам.
+    """
+
+    help = 'Исправляет расхождения счётчиков избранного, корзин и подписок.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--fold', action='store_true',
+            help='Только свернуть шарды счётчиков.'
+        )
+
+    def handle(self, *args, **options):
+        """Сворачивание шардов и пересчёт."""
+        if options['fold']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Свёрнуто шардов: {fold_shards()}.'
+            ))
+            return
+        for field, fixed in reconcile().items():
+            style = self.style.WARNING if fixed else self.style.SUCCESS
+            self.stdout.write(style(f'{field}: исправлено {fixed}'))
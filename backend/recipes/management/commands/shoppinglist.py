@@ -0,0 +1,61 @@
+"""Пересборка и проверка агрегированных списков покупок."""
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Пересборка или проверка таблицы списков покупок."""
+
+    help = 'Пересобирает или проверяет агрегированные списки покупок.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сравнить таблицу с корзинами, ничего не меняя.'
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя; можно указать несколько раз.'
+        )
+
+    def handle(self, *args, **options):
+        """Пересборка или проверка."""
+        user_ids = options['user_ids']
+        if options['verify']:
+            self.verify(user_ids)
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны.'))
+
+    def verify(self, user_ids):
+        """Сравнение хранимых списков с посчитанными заново."""
+        expected = {
+            (row['recipe__shopping_cart__user'], row['ingredient']):
+                row['total']
+            for row in ShoppingListItem.objects.calculate(user_ids).iterator()
+        }
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in items.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        broken_users = {
+            user_id for user_id, ingredient_id in expected.keys() | stored
+            if expected.get((user_id, ingredient_id))
+            != stored.get((user_id, ingredient_id))
+        }
+        if broken_users:
+            raise CommandError(
+                'Списки покупок расходятся с корзинами у пользователей: '
+                + ', '.join(str(user_id) for user_id in sorted(broken_users))
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок совпадают.'))
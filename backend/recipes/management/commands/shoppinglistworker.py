@@ -0,0 +1,125 @@
+"""Фоновая генерация файлов списка покупок."""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connections, transaction
+
+from api.utils import get_shopping_list, render_shopping_list
+from recipes.models import ShoppingListJob
+from users.models import User
+
+
+class Command(BaseCommand):
+    """
+    Воркер заданий на генерацию списков покупок.
+
+    Берёт задания из таблицы ShoppingListJob и рендерит их в пуле
+    процессов ограниченного размера. На сервере запускается один воркер.
+    """
+
+    help = 'Генерирует файлы списков покупок из очереди заданий.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=settings.SHOPPING_LIST_RENDER_CONCURRENCY,
+            help='Максимум одновременных генераций.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза между опросами очереди, в секундах.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать очередь и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        """Цикл обработки очереди."""
+        concurrency = options['concurrency']
+        interval = options['interval']
+        ShoppingListJob.objects.filter(
+            status=ShoppingListJob.RUNNING
+        ).update(status=ShoppingListJob.PENDING)
+        connections.close_all()
+        running = {}
+        with ProcessPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                for future in [f for f in running if f.done()]:
+                    self.finish(running.pop(future), future)
+                claimed = self.claim(concurrency - len(running))
+                for job, ingredients in claimed:
+                    future = pool.submit(
+                        render_shopping_list, job.file_format, ingredients
+                    )
+                    running[future] = job
+                if options['once'] and not running and not claimed:
+                    break
+                if running:
+                    wait(running, timeout=interval,
+                         return_when=FIRST_COMPLETED)
+                elif not claimed:
+                    time.sleep(interval)
+
+    def claim(self, limit):
+        """Забирает до limit заданий из очереди вместе с данными."""
+        if limit <= 0:
+            return []
+        job_ids = ShoppingListJob.objects.filter(
+            status=ShoppingListJob.PENDING
+        ).order_by('created').values_list('id', flat=True)[:limit]
+        claimed = []
+        for job_id in job_ids:
+            if not ShoppingListJob.objects.filter(
+                pk=job_id, status=ShoppingListJob.PENDING
+            ).update(status=ShoppingListJob.RUNNING):
+                continue
+            job = ShoppingListJob.objects.select_related('user').defer(
+                'content'
+            ).get(pk=job_id)
+            ingredients = self.read_version(job)
+            if ingredients is None:
+                ShoppingListJob.objects.filter(pk=job_id).update(
+                    status=ShoppingListJob.SUPERSEDED
+                )
+                continue
+            claimed.append((job, ingredients))
+        return claimed
+
+    @staticmethod
+    @transaction.atomic
+    def read_version(job):
+        """
+        Список покупок версии задания или None, если он уже изменился.
+
+        Строка пользователя блокируется: изменения корзины поднимают
+        версию до изменения строк списка, поэтому прочитанный список
+        соответствует прочитанной версии.
+        """
+        version = User.objects.select_for_update().filter(
+            pk=job.user_id
+        ).values_list('shopping_cart_version', flat=True).first()
+        if version != job.version:
+            return None
+        return list(get_shopping_list(job.user))
+
+    def finish(self, job, future):
+        """Сохраняет результат генерации."""
+        try:
+            content = future.result()
+        except Exception as error:
+            ShoppingListJob.objects.filter(pk=job.pk).update(
+                status=ShoppingListJob.FAILED
+            )
+            self.stderr.write(
+                self.style.ERROR(f'Задание {job.pk}: {error}')
+            )
+            return
+        ShoppingListJob.objects.filter(pk=job.pk).update(
+            status=ShoppingListJob.DONE, content=content
+        )
+        self.stdout.write(self.style.SUCCESS(f'Задание {job.pk} готово.'))
@@ -0,0 +1,32 @@
+"""Расчёт похожих рецептов."""
+
+from django.core.management import BaseCommand
+
+from recipes.similar import update_similar
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт таблицы похожих рецептов.
+
+    По умолчанию обрабатывает только рецепты, изменённые после прошлого
+    запуска, и рецепты, чьи списки от них зависят; запускается по
+    расписанию. С --full пересчитывает подписи и списки всех рецептов,
+    например после смены параметров MinHash.
+    """
+
+    help = 'Пересчитывает похожие рецепты по ингредиентам и тегам.'
+
+    def add_arguments(self, parser):
+        """Аргументы команды."""
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты.'
+        )
+
+    def handle(self, *args, **options):
+        """Пересчёт подписей и списков похожих рецептов."""
+        changed, updated = update_similar(options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Изменённых рецептов: {changed}, обновлено списков: {updated}.'
+        ))
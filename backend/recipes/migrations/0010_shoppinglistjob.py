@@ -0,0 +1,40 @@
+# Generated by Django 3.2.3 on 2026-10-18 01:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_format', models.CharField(max_length=8, verbose_name='Формат')),
+                ('version', models.PositiveIntegerField(verbose_name='Версия списка покупок')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('content', models.BinaryField(null=True, verbose_name='Файл')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Генерация списка покупок',
+                'verbose_name_plural': 'Генерация списков покупок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='shoppinglistjob',
+            index=models.Index(fields=['status', 'created'], name='shopping_list_job_queue_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistjob',
+            constraint=models.UniqueConstraint(fields=('user', 'version', 'file_format'), name='unique shopping list job'),
+        ),
+    ]
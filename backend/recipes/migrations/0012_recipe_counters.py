@@ -0,0 +1,72 @@
+# Generated by Django 3.2.3 on 2026-10-18 01:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rows(model, field):
+    """Подзапрос с числом строк model, ссылающихся на запись."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    """Заполняет счётчики по существующим данным."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    Recipe.objects.update(
+        favorites_count=count_rows(Favorite, 'recipe'),
+        shopping_carts_count=count_rows(ShoppingCart, 'recipe'),
+    )
+    User.objects.update(
+        recipes_count=count_rows(Recipe, 'author'),
+        followers_count=count_rows(Follow, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_hot_path_indexes'),
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.CreateModel(
+            name='RecipeCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('counter', models.CharField(choices=[('favorites', 'Избранное'), ('shopping_carts', 'Списки покупок')], max_length=16, verbose_name='Счётчик')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Шард')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Шард счётчика',
+                'verbose_name_plural': 'Шарды счётчиков',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipecountershard',
+            constraint=models.UniqueConstraint(fields=('recipe', 'counter', 'shard'), name='unique recipe counter shard'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.3 on 2026-10-18 01:43
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=['search_vector'], name='recipe_search_vector_idx'
+)
+
+
+def is_postgresql(schema_editor):
+    """Полнотекстовый поиск есть только в PostgreSQL."""
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+def add_search_index(apps, schema_editor):
+    """GIN-индекс и заполнение вектора поиска."""
+    if not is_postgresql(schema_editor):
+        return
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector('text', weight='B', config='russian')
+    ))
+    schema_editor.add_index(Recipe, SEARCH_INDEX)
+
+
+def remove_search_index(apps, schema_editor):
+    """Удаление GIN-индекса."""
+    if is_postgresql(schema_editor):
+        schema_editor.remove_index(
+            apps.get_model('recipes', 'Recipe'), SEARCH_INDEX
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Вектор поиска'),
+        ),
+        # В SQLite нет GIN-индексов: там поиск идёт без вектора.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='recipe', index=SEARCH_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_search_index, remove_search_index),
+            ],
+        ),
+    ]
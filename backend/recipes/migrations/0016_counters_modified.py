@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-18 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_similar_recipes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='counters_modified',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Изменение счётчиков'),
+        ),
+        migrations.AddField(
+            model_name='recipecountershard',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменён'),
+        ),
+    ]
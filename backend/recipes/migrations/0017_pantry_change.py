@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_counters_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PantryChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.BigIntegerField(verbose_name='Рецепт')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Изменение индекса продуктов',
+                'verbose_name_plural': 'Журнал индекса продуктов',
+            },
+        ),
+    ]
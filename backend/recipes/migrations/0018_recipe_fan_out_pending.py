@@ -0,0 +1,39 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+FEED_BACKFILL_SIZE = 100
+
+
+def mark_pending(apps, schema_editor):
+    """Последние рецепты авторов, читаемых лентой напрямую."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    authors = User.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('pk', flat=True)
+    for author_id in authors.iterator():
+        recipe_ids = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date'
+        ).values_list('id', flat=True)[:FEED_BACKFILL_SIZE]
+        Recipe.objects.filter(pk__in=list(recipe_ids)).update(
+            fan_out_pending=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_pantry_change'),
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fan_out_pending',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Не разложен по лентам'),
+        ),
+        migrations.RunPython(mark_pending, migrations.RunPython.noop),
+    ]
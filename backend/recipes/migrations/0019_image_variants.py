@@ -0,0 +1,47 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:21
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from api.constants import AVATAR_IMAGE_VARIANTS, RECIPE_IMAGE_VARIANTS
+from recipes.images import variant_name
+
+IMAGE_FIELDS = (
+    ('recipes', 'Recipe', 'image', RECIPE_IMAGE_VARIANTS),
+    ('users', 'User', 'avatar', AVATAR_IMAGE_VARIANTS),
+)
+
+
+def record_variants(apps, schema_editor):
+    """Отмечает копии картинок, уже лежащие в хранилище."""
+    for app_label, model_name, field, variants in IMAGE_FIELDS:
+        model = apps.get_model(app_label, model_name)
+        names = model.objects.exclude(**{field: ''}).exclude(
+            **{f'{field}__isnull': True}
+        ).order_by().values_list(field, flat=True).distinct()
+        for name in names.iterator():
+            available = sorted(
+                variant for variant, size in variants.items()
+                if default_storage.exists(variant_name(name, variant, size))
+            )
+            if available:
+                model.objects.filter(**{field: name}).update(
+                    **{f'{field}_variants': available}
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_fan_out_pending'),
+        ('users', '0006_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(default=list, editable=False, verbose_name='Созданные копии картинки'),
+        ),
+        migrations.RunPython(record_variants, migrations.RunPython.noop),
+    ]
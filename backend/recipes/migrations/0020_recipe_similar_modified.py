@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='similar_modified',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Изменение для похожих рецептов'),
+        ),
+    ]
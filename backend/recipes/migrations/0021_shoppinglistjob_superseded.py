@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_recipe_similar_modified'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shoppinglistjob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка'), ('superseded', 'Список изменился')], default='pending', max_length=16, verbose_name='Статус'),
+        ),
+    ]
@@ -1,17 +1,43 @@
 """Models  рецептов."""
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import UniqueConstraint
-
-from api.constants import (AMOUNT_LIMIT, MAX_LEN_NAME_INGREDIENT,
-                           MAX_LEN_NAME_RECIPE, MAX_LEN_NAME_SLUG,
-                           MAX_LEN_NAME_TAG, MAX_LEN_NAME_UNIT,
-                           MAX_LEN_SHORT_CODE)
+from django.db import connections, models
+from django.db.models import (
+    BooleanField, Case, Count, Exists, ExpressionWrapper, F, IntegerField,
+    Max, OuterRef, Prefetch, Q, Subquery, Sum, UniqueConstraint, Value, When
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from api.constants import (AMOUNT_LIMIT, MAX_LEN_COUNTER_NAME,
+                           MAX_LEN_FILE_FORMAT, MAX_LEN_JOB_STATUS,
+                           MAX_LEN_NAME_INGREDIENT, MAX_LEN_NAME_RECIPE,
+                           MAX_LEN_NAME_SLUG, MAX_LEN_NAME_TAG,
+                           MAX_LEN_NAME_UNIT, MAX_LEN_SHORT_CODE,
+                           RECIPE_SEARCH_CONFIG)
 
 User = get_user_model()
 
+SHOPPING_LIST_BATCH_SIZE = 1000
+
+
+def recipe_search_vector():
+    """Вектор поиска рецепта: название весомее описания."""
+    return (
+        SearchVector('name', weight='A', config=RECIPE_SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=RECIPE_SEARCH_CONFIG)
+    )
+
+
+def normalize_search_name(value):
+    """Ключ поиска: без пробелов по краям, casefold, ё заменена на е."""
+    return value.strip().casefold().replace('ё', 'е')
+
 
 class Tag(models.Model):
     """Модель тега."""
@@ -48,6 +74,11 @@ class Ingredient(models.Model):
         max_length=MAX_LEN_NAME_UNIT,
         verbose_name='Единица измерения'
     )
+    search_name = models.CharField(
+        max_length=MAX_LEN_NAME_INGREDIENT,
+        editable=False,
+        verbose_name='Ключ поиска'
+    )
 
     class Meta:
         """Meta class ингредиентов."""
@@ -59,11 +90,160 @@ class Ingredient(models.Model):
             models.UniqueConstraint(fields=['name', 'measurement_unit'],
                                     name='unique_ingredient')
         ]
+        indexes = [
+            models.Index(
+                fields=['search_name'],
+                name='ingredient_search_name_idx',
+                opclasses=['varchar_pattern_ops']
+            )
+        ]
 
     def __str__(self):
         """Строковое представление."""
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Сохранение ингредиента с ключом поиска."""
+        self.search_name = normalize_search_name(self.name)
+        super().save(*args, **kwargs)
+
+
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов."""
+
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного и списка покупок пользователя."""
+        if not user.is_authenticated:
+            return self.annotate(
+                favorited=Value(False, output_field=BooleanField()),
+                in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
+    def limited_per_author(self, limit):
+        """Не более limit последних рецептов каждого автора одним запросом."""
+        if limit is None:
+            return self
+        return self.filter(pk__in=Subquery(
+            self.model.objects.filter(
+                author=OuterRef('author')
+            ).values('pk')[:limit]
+        ))
+
+    def with_counters(self):
+        """
+        Аннотирует счётчики с учётом ещё не свёрнутых шардов.
+
+        Без шардирования счётчики читаются прямо из колонок рецепта.
+        """
+        if not settings.RECIPE_COUNTER_SHARDS:
+            return self
+        return self.annotate(**{
+            f'{counter}_total': ExpressionWrapper(
+                F(f'{counter}_count') + Coalesce(Subquery(
+                    RecipeCounterShard.objects.filter(
+                        recipe=OuterRef('pk'), counter=counter
+                    ).order_by().values('recipe').annotate(
+                        total=Sum('value')
+                    ).values('total')
+                ), 0),
+                output_field=IntegerField()
+            )
+            for counter, _ in RecipeCounterShard.COUNTERS
+        })
+
+    @property
+    def full_text(self):
+        """Полнотекстовый поиск доступен: база PostgreSQL."""
+        return connections[self.db].vendor == 'postgresql'
+
+    def update_search_vector(self):
+        """Пересчитывает колонку search_vector одним UPDATE."""
+        if not self.full_text:
+            return 0
+        return self.update(search_vector=recipe_search_vector())
+
+    def mark_similar_stale(self):
+        """Ставит рецепты в очередь пересчёта похожих, не меняя pub_date."""
+        return self.update(similar_modified=timezone.now())
+
+    def search(self, value):
+        """
+        Рецепты по запросу, самые релевантные сначала.
+
+        В PostgreSQL поиск по search_vector с ранжированием SearchRank.
+        В остальных базах каждое слово ищется подстрокой в названии
+        или описании, выше рецепты с большим числом слов в названии.
+        """
+        words = value.split()
+        if not words:
+            return self
+        if self.full_text:
+            query = SearchQuery(
+                value, config=RECIPE_SEARCH_CONFIG, search_type='websearch'
+            )
+            return self.filter(search_vector=query).annotate(
+                search_rank=SearchRank(F('search_vector'), query)
+            ).order_by('-search_rank', '-pub_date', 'id')
+        queryset = self
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(text__icontains=word)
+            )
+        return queryset.annotate(
+            search_rank=sum(
+                Case(
+                    When(name__icontains=word, then=Value(1)),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+                for word in words
+            )
+        ).order_by('-search_rank', '-pub_date', 'id')
+
+    def change_state(self):
+        """
+        Количество, последний id и время последнего изменения рецептов.
+
+        Счётчики меняются через UPDATE без pub_date, поэтому во время
+        изменения входят counters_modified и изменения шардов.
+        """
+        state = self.order_by().aggregate(
+            count=Count('id'), last_id=Max('id'), pub_date=Max('pub_date'),
+            counters_modified=Max('counters_modified')
+        )
+        dates = [state['pub_date'], state['counters_modified']]
+        if settings.RECIPE_COUNTER_SHARDS:
+            dates.append(RecipeCounterShard.objects.filter(
+                recipe__in=self.order_by().values('pk')
+            ).aggregate(modified=Max('modified'))['modified'])
+        return (
+            state['count'], state['last_id'],
+            max((date for date in dates if date), default=None)
+        )
+
+    def for_read(self, user):
+        """Рецепты со связанными данными для полного отображения."""
+        return self.with_user_flags(user).with_counters().prefetch_related(
+            Prefetch(
+                'author', queryset=User.objects.with_is_subscribed(user)
+            ),
+            'tags',
+            Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
 
 class Recipe(models.Model):
     """Модель рецепт."""
@@ -91,6 +271,11 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Картинка'
     )
+    image_variants = models.JSONField(
+        default=list,
+        editable=False,
+        verbose_name='Созданные копии картинки'
+    )
     name = models.CharField(
         max_length=MAX_LEN_NAME_RECIPE,
         verbose_name='Название',
@@ -127,6 +312,38 @@ class Recipe(models.Model):
         auto_now=True,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    shopping_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    counters_modified = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name='Изменение счётчиков'
+    )
+    fan_out_pending = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Не разложен по лентам'
+    )
+    similar_modified = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name='Изменение для похожих рецептов'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Вектор поиска'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         """Meta class рецепт."""
@@ -134,6 +351,20 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', 'id'],
+                name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx'
+            ),
+        ]
 
     def __str__(self):
         """Строковое представление."""
@@ -247,3 +478,409 @@ class ShoppingCart(models.Model):
     def __str__(self):
         """Строковое представление."""
         return f'{self.recipe} в корзине у {self.user}'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    """QuerySet агрегированного списка покупок."""
+
+    def bump_version(self, user_ids=None):
+        """Увеличивает версию списка покупок пользователей."""
+        users = User.objects.all()
+        if user_ids is not None:
+            users = users.filter(pk__in=user_ids)
+        users.update(shopping_cart_version=F('shopping_cart_version') + 1)
+
+    def add_recipes(self, recipe_ids, user_ids, sign=1):
+        """
+        Прибавляет ингредиенты рецептов к спискам покупок пользователей.
+
+        Без рецептов или пользователей ничего не меняется, и версия
+        списка не растёт: повторное добавление не сбивает кэш документа.
+        """
+        recipe_ids = list(recipe_ids)
+        user_ids = list(user_ids)
+        if not recipe_ids or not user_ids:
+            return
+        self.bump_version(user_ids)
+        recipe_ingredients = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        )
+        ingredient_ids = set(
+            recipe_ingredients.values_list('ingredient_id', flat=True)
+        )
+        if not ingredient_ids:
+            return
+        if sign > 0:
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id, ingredient_id=ingredient_id, amount=0
+                    )
+                    for user_id in user_ids
+                    for ingredient_id in ingredient_ids
+                ),
+                batch_size=SHOPPING_LIST_BATCH_SIZE,
+                ignore_conflicts=True
+            )
+        amount = Subquery(recipe_ingredients.filter(
+            ingredient=OuterRef('ingredient')
+        ).order_by().values('ingredient').annotate(
+            total=Sum('amount')
+        ).values('total'))
+        items = self.filter(user__in=user_ids, ingredient__in=ingredient_ids)
+        items.update(
+            amount=Greatest(F('amount') + amount * sign, Value(0))
+        )
+        if sign < 0:
+            items.filter(amount=0).delete()
+
+    def remove_recipes(self, recipe_ids, user_ids):
+        """Вычитает ингредиенты рецептов из списков покупок пользователей."""
+        self.add_recipes(recipe_ids, user_ids, sign=-1)
+
+    def add_recipe(self, recipe_id, user_ids):
+        """Прибавляет ингредиенты рецепта к спискам покупок пользователей."""
+        self.add_recipes((recipe_id,), user_ids)
+
+    def remove_recipe(self, recipe_id, user_ids):
+        """Вычитает ингредиенты рецепта из списков покупок пользователей."""
+        self.remove_recipes((recipe_id,), user_ids)
+
+    def calculate(self, user_ids=None):
+        """Список покупок, посчитанный заново по корзинам пользователей."""
+        recipe_ingredients = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__isnull=False
+        )
+        if user_ids is not None:
+            recipe_ingredients = recipe_ingredients.filter(
+                recipe__shopping_cart__user__in=user_ids
+            )
+        return recipe_ingredients.values(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def rebuild(self, user_ids=None):
+        """Пересчитывает списки покупок пользователей с нуля."""
+        items = self.all()
+        if user_ids is not None:
+            items = items.filter(user__in=user_ids)
+        items.delete()
+        self.bulk_create(
+            (
+                self.model(
+                    user_id=row['recipe__shopping_cart__user'],
+                    ingredient_id=row['ingredient'],
+                    amount=row['total']
+                )
+                for row in self.calculate(user_ids).iterator()
+            ),
+            batch_size=SHOPPING_LIST_BATCH_SIZE
+        )
+        self.bump_version(user_ids)
+
+
+class ShoppingListItem(models.Model):
+    """Модель ингредиента в агрегированном списке покупок."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        """Meta class списка покупок."""
+
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique ingredient in shopping list'
+            ),
+        )
+
+    def __str__(self):
+        """Строковое представление."""
+        return f'{self.ingredient}: {self.amount} у {self.user}'
+
+
+class ShoppingListJob(models.Model):
+    """
+    Задание на фоновую генерацию файла списка покупок.
+
+    Задание рендерит список версии version; если к началу генерации
+    список изменился, задание получает статус SUPERSEDED, и клиент
+    запрашивает документ заново.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    SUPERSEDED = 'superseded'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+        (SUPERSEDED, 'Список изменился'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list_jobs'
+    )
+    file_format = models.CharField(
+        max_length=MAX_LEN_FILE_FORMAT,
+        verbose_name='Формат'
+    )
+    version = models.PositiveIntegerField(
+        verbose_name='Версия списка покупок'
+    )
+    status = models.CharField(
+        max_length=MAX_LEN_JOB_STATUS,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус'
+    )
+    content = models.BinaryField(null=True, verbose_name='Файл')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создано'
+    )
+
+    class Meta:
+        """Meta class заданий."""
+
+        verbose_name = 'Генерация списка покупок'
+        verbose_name_plural = 'Генерация списков покупок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'version', 'file_format'),
+                name='unique shopping list job'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('status', 'created'),
+                name='shopping_list_job_queue_idx'
+            ),
+        )
+
+    def __str__(self):
+        """Строковое представление."""
+        return f'{self.file_format} для {self.user}: {self.status}'
+
+
+class RecipeCounterShard(models.Model):
+    """
+    Часть счётчика рецепта.
+
+    При RECIPE_COUNTER_SHARDS > 0 изменения счётчиков популярных
+    рецептов распределяются по нескольким строкам вместо одной строки
+    рецепта. Команда reconcilecounters сворачивает их в колонки Recipe.
+    """
+
+    FAVORITES = 'favorites'
+    SHOPPING_CARTS = 'shopping_carts'
+    COUNTERS = (
+        (FAVORITES, 'Избранное'),
+        (SHOPPING_CARTS, 'Списки покупок'),
+    )
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='counter_shards'
+    )
+    counter = models.CharField(
+        max_length=MAX_LEN_COUNTER_NAME,
+        choices=COUNTERS,
+        verbose_name='Счётчик'
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name='Шард')
+    value = models.IntegerField(default=0, verbose_name='Значение')
+    modified = models.DateTimeField(auto_now=True, verbose_name='Изменён')
+
+    class Meta:
+        """Meta class шардов счётчиков."""
+
+        verbose_name = 'Шард счётчика'
+        verbose_name_plural = 'Шарды счётчиков'
+        constraints = (
+            UniqueConstraint(
+                fields=('recipe', 'counter', 'shard'),
+                name='unique recipe counter shard'
+            ),
+        )
+
+    def __str__(self):
+        """Строковое представление."""
+        return f'{self.recipe}: {self.counter}[{self.shard}] = {self.value}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписчика.
+
+    Строки создаются при публикации рецепта для всех подписчиков автора
+    и при подписке на автора; pub_date копирует дату рецепта, чтобы
+    страница ленты читалась по индексу без JOIN, и обновляется вместе
+    с ней при изменении рецепта.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='timeline'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='timeline_entries'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        """Meta class ленты."""
+
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique timeline recipe'
+            ),
+        )
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        """Строковое представление."""
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class RecipeSignature(models.Model):
+    """
+    MinHash-подпись множества ингредиентов и тегов рецепта.
+
+    computed_at сравнивается с pub_date и similar_modified рецепта, чтобы
+    пересчитывать только изменённые рецепты.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Рецепт'
+    )
+    signature = models.BinaryField(verbose_name='Подпись')
+    computed_at = models.DateTimeField(verbose_name='Дата расчёта')
+
+    class Meta:
+        """Meta class подписи рецепта."""
+
+        verbose_name = 'Подпись рецепта'
+        verbose_name_plural = 'Подписи рецептов'
+
+    def __str__(self):
+        """Строковое представление."""
+        return f'Подпись {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    """Похожий рецепт с оценкой сходства Жаккара."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        """Meta class похожего рецепта."""
+
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique similar recipe'
+            ),
+        )
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        """Строковое представление."""
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class PantryChange(models.Model):
+    """
+    Рецепт, у которого изменились ингредиенты.
+
+    Журнал индекса продуктов: процессы читают строки после последней
+    применённой и обновляют индекс только по этим рецептам. Внешнего
+    ключа нет, чтобы удаление рецепта тоже попадало в журнал.
+    """
+
+    recipe_id = models.BigIntegerField(verbose_name='Рецепт')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Создано'
+    )
+
+    class Meta:
+        """Meta class журнала индекса продуктов."""
+
+        verbose_name = 'Изменение индекса продуктов'
+        verbose_name_plural = 'Журнал индекса продуктов'
+
+    def __str__(self):
+        """Строковое представление."""
+        return f'Рецепт {self.recipe_id}'
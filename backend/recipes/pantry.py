@@ -0,0 +1,170 @@
+"""Подбор рецептов по продуктам в наличии."""
+
+from copy import copy
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Max
+from django.utils import timezone
+
+from recipes.models import PantryChange, RecipeIngredient
+
+PANTRY_INDEX_CHUNK_SIZE = 10000
+PANTRY_CHANGE_GRACE = timedelta(minutes=1)
+PANTRY_CHANGE_RETENTION = timedelta(days=1)
+
+_index = None
+
+
+def frozen(array):
+    """Массив только для чтения: индекс не меняется после создания."""
+    array.flags.writeable = False
+    return array
+
+
+class PantryIndex:
+    """
+    Обратный индекс ингредиент → рецепты.
+
+    Пары (ингредиент, рецепт) хранятся двумя массивами, отсортированными
+    по ингредиенту, плюс число ингредиентов каждого рецепта. Индекс
+    неизменяем: применение журнала создаёт новый, поэтому запросы,
+    ранжирующие по прежнему, читают его без блокировок.
+    """
+
+    def __init__(self, sequence, ingredients, recipes, synced):
+        """Индекс с применённым журналом до строки sequence."""
+        order = np.lexsort((recipes, ingredients))
+        self.sequence = sequence
+        self.ingredients = frozen(ingredients[order])
+        self.recipes = frozen(recipes[order])
+        self.required = frozen(np.bincount(recipes))
+        self.synced = synced
+
+    @staticmethod
+    def read(queryset):
+        """Массивы ингредиентов и рецептов из строк RecipeIngredient."""
+        rows = np.array(list(queryset.values_list(
+            'ingredient_id', 'recipe_id'
+        ).iterator(chunk_size=PANTRY_INDEX_CHUNK_SIZE)), dtype=np.int64)
+        rows = rows.reshape(-1, 2)
+        return rows[:, 0], rows[:, 1]
+
+    @classmethod
+    def build(cls, now):
+        """
+        Индекс по всем строкам RecipeIngredient.
+
+        Позиция в журнале берётся до чтения строк и с запасом
+        PANTRY_CHANGE_GRACE: изменения незафиксированных транзакций будут
+        применены повторно, это безопасно.
+        """
+        sequence = PantryChange.objects.filter(
+            created__lt=now - PANTRY_CHANGE_GRACE
+        ).aggregate(Max('id'))['id__max'] or 0
+        return cls(sequence, *cls.read(RecipeIngredient.objects), now)
+
+    def applied(self, recipe_ids, sequence, now):
+        """Новый индекс с заново прочитанными строками рецептов."""
+        recipe_ids = list(recipe_ids)
+        kept = ~np.isin(self.recipes, recipe_ids)
+        ingredients, recipes = self.read(
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        )
+        return PantryIndex(
+            sequence,
+            np.concatenate((self.ingredients[kept], ingredients)),
+            np.concatenate((self.recipes[kept], recipes)),
+            now
+        )
+
+    def synced_at(self, now):
+        """Тот же индекс с новым временем сверки с журналом."""
+        index = copy(self)
+        index.synced = now
+        return index
+
+    def rank(self, ingredient_ids):
+        """
+        Рецепты хотя бы с одним из ингредиентов.
+
+        Список (id рецепта, доля имеющихся ингредиентов, сколько не
+        хватает): сначала наибольшая доля, затем меньше недостающих.
+        """
+        ingredient_ids = np.unique(np.asarray(
+            list(ingredient_ids), dtype=np.int64
+        ))
+        starts = np.searchsorted(self.ingredients, ingredient_ids, 'left')
+        ends = np.searchsorted(self.ingredients, ingredient_ids, 'right')
+        if not (ends > starts).any():
+            return []
+        recipe_ids, hits = np.unique(np.concatenate([
+            self.recipes[start:end] for start, end in zip(starts, ends)
+        ]), return_counts=True)
+        required = self.required[recipe_ids]
+        coverage = hits / required
+        missing = required - hits
+        order = np.lexsort((recipe_ids, missing, -coverage))
+        return list(zip(
+            recipe_ids[order].tolist(),
+            coverage[order].tolist(),
+            missing[order].tolist()
+        ))
+
+
+def pending_changes(index, now):
+    """
+    Строки журнала после позиции индекса и новая позиция.
+
+    Строка после пропуска в номерах может принадлежать ещё не
+    зафиксированной транзакции, поэтому позиция переходит через пропуск
+    только через PANTRY_CHANGE_GRACE; строки за пропуском применяются
+    сразу и, пока он не закрыт, повторно.
+    """
+    changes = list(PantryChange.objects.filter(
+        id__gt=index.sequence
+    ).order_by('id').values_list('id', 'recipe_id', 'created'))
+    sequence = index.sequence
+    for change_id, _, created in changes:
+        if change_id != sequence + 1 and created > now - PANTRY_CHANGE_GRACE:
+            break
+        sequence = change_id
+    return {recipe_id for _, recipe_id, _ in changes}, sequence
+
+
+def get_pantry_index():
+    """
+    Актуальный индекс процесса.
+
+    Индекс строится один раз и затем на каждом запросе догоняет журнал
+    PantryChange: перечитываются только изменённые рецепты. Журнал
+    хранится PANTRY_CHANGE_RETENTION; процесс, не сверявшийся дольше,
+    строит индекс заново, и тогда же старые строки журнала удаляются.
+    """
+    global _index
+    now = timezone.now()
+    index = _index
+    if index is None or now - index.synced > PANTRY_CHANGE_RETENTION:
+        PantryChange.objects.filter(
+            created__lt=now - PANTRY_CHANGE_RETENTION
+        ).delete()
+        index = PantryIndex.build(now)
+    recipe_ids, sequence = pending_changes(index, now)
+    if recipe_ids:
+        index = index.applied(recipe_ids, sequence, now)
+    else:
+        index = index.synced_at(now)
+    _index = index
+    return index
+
+
+def update_pantry_index(recipe_ids):
+    """
+    Записывает в журнал рецепты с изменёнными ингредиентами.
+
+    Строки пишутся в текущей транзакции и видны процессам вместе с
+    самими изменениями.
+    """
+    PantryChange.objects.bulk_create(
+        PantryChange(recipe_id=recipe_id) for recipe_id in set(recipe_ids)
+    )
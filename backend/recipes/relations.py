@@ -0,0 +1,162 @@
+"""Избранное, корзина и подписки с пересчётом агрегатов."""
+
+from collections import Counter
+
+from django.db import IntegrityError, connection, transaction
+
+from recipes.counters import change_recipe_counter, change_user_counter
+from recipes.feed import catch_up, prune
+from recipes.models import (Favorite, RecipeCounterShard, ShoppingCart,
+                            ShoppingListItem)
+from users.models import Follow
+
+RECIPE_RELATIONS = {
+    Favorite: RecipeCounterShard.FAVORITES,
+    ShoppingCart: RecipeCounterShard.SHOPPING_CARTS,
+}
+
+
+def insert_user_recipes(model, user_id, recipe_ids):
+    """
+    Вставляет строки пользователя, возвращает id действительно вставленных.
+
+    В PostgreSQL один INSERT ... ON CONFLICT DO NOTHING RETURNING, в
+    остальных базах по строке в точке сохранения.
+    """
+    if connection.vendor == 'postgresql':
+        table, user, recipe = (
+            connection.ops.quote_name(name) for name in (
+                model._meta.db_table,
+                model._meta.get_field('user').column,
+                model._meta.get_field('recipe').column,
+            )
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {recipe}) '
+                'SELECT %s, unnest(%s::bigint[]) '
+                f'ON CONFLICT DO NOTHING RETURNING {recipe}',
+                [user_id, list(recipe_ids)]
+            )
+            return [recipe_id for recipe_id, in cursor.fetchall()]
+    inserted = []
+    for recipe_id in recipe_ids:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    (model(user_id=user_id, recipe_id=recipe_id),)
+                )
+        except IntegrityError:
+            continue
+        inserted.append(recipe_id)
+    return inserted
+
+
+@transaction.atomic
+def add_user_recipes(model, user_id, recipe_ids):
+    """
+    Добавляет рецепты в избранное или корзину пользователя.
+
+    Список покупок и счётчики меняются только по вставленным строкам:
+    строки, добавленные параллельным запросом, не учитываются дважды.
+    Возвращает id добавленных рецептов.
+    """
+    inserted = insert_user_recipes(model, user_id, recipe_ids)
+    if model is ShoppingCart:
+        ShoppingListItem.objects.add_recipes(inserted, (user_id,))
+    change_recipe_counter(inserted, RECIPE_RELATIONS[model], 1)
+    return inserted
+
+
+def user_recipes_removed(model, user_id, recipe_ids):
+    """Список покупок и счётчики после удаления строк пользователя."""
+    if model is ShoppingCart:
+        ShoppingListItem.objects.remove_recipes(recipe_ids, (user_id,))
+    change_recipe_counter(recipe_ids, RECIPE_RELATIONS[model], -1)
+
+
+@transaction.atomic
+def remove_user_recipe(model, user_id, recipe_id):
+    """
+    Убирает рецепт из избранного или корзины пользователя.
+
+    Строка удаляется одним DELETE без сигналов, список покупок и
+    счётчики меняются, только если она действительно была удалена:
+    повторный запрос ничего не вычитает. Возвращает, была ли строка.
+    """
+    deleted, _ = model.objects.filter(
+        user_id=user_id, recipe_id=recipe_id
+    ).delete()
+    if deleted:
+        user_recipes_removed(model, user_id, (recipe_id,))
+    return bool(deleted)
+
+
+@transaction.atomic
+def remove_user_recipes(queryset):
+    """
+    Удаляет строки избранного или корзины из queryset.
+
+    Строки блокируются select_for_update: параллельное удаление тех же
+    строк дождётся фиксации и не найдёт их. Агрегаты меняются только по
+    удалённым строкам. Возвращает пары (id пользователя, id рецепта).
+    """
+    model = queryset.model
+    rows = list(queryset.select_for_update().values_list(
+        'pk', 'user_id', 'recipe_id'
+    ))
+    if not rows:
+        return []
+    model.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    by_user = {}
+    for _, user_id, recipe_id in rows:
+        by_user.setdefault(user_id, []).append(recipe_id)
+    if model is ShoppingCart:
+        for user_id, recipe_ids in by_user.items():
+            ShoppingListItem.objects.remove_recipes(recipe_ids, (user_id,))
+    by_count = {}
+    for recipe_id, count in Counter(
+        recipe_id for _, _, recipe_id in rows
+    ).items():
+        by_count.setdefault(count, []).append(recipe_id)
+    for count, recipe_ids in by_count.items():
+        change_recipe_counter(recipe_ids, RECIPE_RELATIONS[model], -count)
+    return [(user_id, recipe_id) for _, user_id, recipe_id in rows]
+
+
+@transaction.atomic
+def unsubscribe(user_id, author_id):
+    """
+    Отписка одним DELETE.
+
+    Счётчик подписчиков и лента меняются, только если подписка была.
+    Если подписчиков стало не больше порога, рецепты автора, не
+    разложенные по лентам, раскладываются.
+    """
+    deleted, _ = Follow.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+    if deleted:
+        change_user_counter((author_id,), 'followers_count', -1)
+        prune(user_id, author_id)
+        catch_up((author_id,))
+    return bool(deleted)
+
+
+@transaction.atomic
+def remove_follows(queryset):
+    """Удаляет подписки из queryset, агрегаты по удалённым строкам."""
+    rows = list(queryset.select_for_update().values_list(
+        'pk', 'user_id', 'author_id'
+    ))
+    if not rows:
+        return []
+    Follow.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    for author_id, count in Counter(
+        author_id for _, _, author_id in rows
+    ).items():
+        change_user_counter((author_id,), 'followers_count', -count)
+    for _, user_id, author_id in rows:
+        prune(user_id, author_id)
+    catch_up({author_id for _, _, author_id in rows})
+    return [(user_id, author_id) for _, user_id, author_id in rows]
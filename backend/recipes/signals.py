@@ -0,0 +1,234 @@
+"""Сигналы рецептов."""
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.conditional import bump_catalog_version
+from api.constants import AVATAR_IMAGE_VARIANTS, RECIPE_IMAGE_VARIANTS
+from api.short_links import short_link_key
+from recipes.counters import (change_recipe_counter, change_user_counter,
+                              recount_recipes, recount_users)
+from recipes.feed import backfill, catch_up, fan_out, refresh
+from recipes.images import make_variants, variants_field
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeCounterShard,
+                            ShoppingCart, ShoppingListItem, SimilarRecipe,
+                            Tag)
+from recipes.pantry import update_pantry_index
+from users.models import Follow, User
+
+IMAGE_FIELDS = {
+    Recipe: ('image', RECIPE_IMAGE_VARIANTS),
+    User: ('avatar', AVATAR_IMAGE_VARIANTS),
+}
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    """Добавляет ингредиенты рецепта в список покупок."""
+    if created:
+        ShoppingListItem.objects.add_recipe(
+            instance.recipe_id, [instance.user_id]
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def collect_cart_users(sender, instance, **kwargs):
+    """Запоминает пользователей, у которых рецепт в корзине."""
+    instance.cart_user_ids = list(ShoppingCart.objects.filter(
+        recipe=instance
+    ).values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def rebuild_shopping_lists(sender, instance, **kwargs):
+    """
+    Списки покупок после удаления рецепта вместе с корзинами.
+
+    Строки корзин удаляются каскадом, поэтому списки пересчитываются
+    заново после фиксации: повторное удаление того же рецепта ничего не
+    вычтет дважды, а пользователи, удалённые вместе с рецептом, уже не
+    получат строк.
+    """
+    user_ids = getattr(instance, 'cart_user_ids', None)
+    if user_ids:
+        transaction.on_commit(
+            lambda: ShoppingListItem.objects.rebuild(user_ids)
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def update_catalog_version(sender, **kwargs):
+    """Новая версия справочника для ETag."""
+    bump_catalog_version(sender)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def bump_shopping_list_versions(sender, instance, **kwargs):
+    """
+    Новая версия списков покупок с изменённым ингредиентом.
+
+    Документы кэшируются по версии списка, поэтому после переименования
+    ингредиента или смены единицы измерения пользователи получат файл
+    с новыми названиями.
+    """
+    if kwargs.get('created'):
+        return
+    ShoppingListItem.objects.bump_version(
+        ShoppingListItem.objects.filter(ingredient=instance).values('user_id')
+    )
+
+
+@receiver(post_save, sender=User)
+def update_profile_version(sender, update_fields=None, **kwargs):
+    """Новая версия профилей, встроенных в ответы с рецептами."""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    bump_catalog_version(sender)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def create_image_variants(sender, instance, update_fields=None, **kwargs):
+    """
+    Уменьшенные копии загруженной картинки.
+
+    Созданные варианты записываются в поле модели. Картинки, которые
+    не удалось прочитать, остаются без вариантов: их копии можно
+    создать позже командой imagevariants.
+    """
+    field, variants = IMAGE_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    field_file = getattr(instance, field)
+    available = []
+    if field_file:
+        try:
+            _, available = make_variants(field_file, variants)
+        except OSError:
+            pass
+    name = variants_field(field_file)
+    if getattr(instance, name) != available:
+        setattr(instance, name, available)
+        sender.objects.filter(pk=instance.pk).update(**{name: available})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def update_recipe_counters(sender, instance, created, **kwargs):
+    """
+    Счётчики избранного и списков покупок рецепта.
+
+    Удаления обрабатывает recipes.relations по числу удалённых строк.
+    """
+    if not created:
+        return
+    counter = (
+        RecipeCounterShard.FAVORITES if sender is Favorite
+        else RecipeCounterShard.SHOPPING_CARTS
+    )
+    change_recipe_counter((instance.recipe_id,), counter, 1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def update_user_counters(sender, instance, created, **kwargs):
+    """Счётчики рецептов и подписчиков автора."""
+    if not created:
+        return
+    field = 'recipes_count' if sender is Recipe else 'followers_count'
+    change_user_counter((instance.author_id,), field, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recount_author(sender, instance, **kwargs):
+    """Число рецептов автора заново после удаления рецепта."""
+    recount_users((instance.author_id,))
+
+
+@receiver(pre_delete, sender=User)
+def collect_user_relations(sender, instance, **kwargs):
+    """Запоминает рецепты и авторов, чьи счётчики зависят от пользователя."""
+    instance.related_recipe_ids = set(Favorite.objects.filter(
+        user=instance
+    ).values_list('recipe_id', flat=True)) | set(ShoppingCart.objects.filter(
+        user=instance
+    ).values_list('recipe_id', flat=True))
+    instance.followed_author_ids = list(Follow.objects.filter(
+        user=instance
+    ).values_list('author_id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def recount_user_relations(sender, instance, **kwargs):
+    """
+    Счётчики после удаления пользователя.
+
+    Его избранное, корзина и подписки удаляются каскадом без сигналов,
+    поэтому счётчики затронутых рецептов и авторов пересчитываются.
+    """
+    recount_recipes(getattr(instance, 'related_recipe_ids', ()))
+    recount_users(getattr(instance, 'followed_author_ids', ()))
+    catch_up(getattr(instance, 'followed_author_ids', ()))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, update_fields=None,
+                   **kwargs):
+    """Новый рецепт в ленты подписчиков автора, изменённый — с новой датой."""
+    if created:
+        fan_out((instance,))
+    elif update_fields is None or 'pub_date' in update_fields:
+        refresh(instance)
+
+
+@receiver(post_save, sender=Follow)
+def update_timeline(sender, instance, created, **kwargs):
+    """
+    Рецепты автора в ленте нового подписчика.
+
+    При отписке лента чистится в recipes.relations.
+    """
+    if created:
+        backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(sender, instance, update_fields=None, **kwargs):
+    """Вектор поиска после изменения названия или описания."""
+    if update_fields is not None and not {'name', 'text'} & update_fields:
+        return
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_pantry_index(sender, instance, **kwargs):
+    """Удалённый рецепт уходит из индекса продуктов."""
+    update_pantry_index((instance.pk,))
+
+
+@receiver(pre_delete, sender=Recipe)
+def collect_similar_recipes(sender, instance, **kwargs):
+    """Запоминает рецепты, в чьих списках похожих есть удаляемый."""
+    instance.similar_recipe_ids = list(SimilarRecipe.objects.filter(
+        similar=instance
+    ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def refill_similar_recipes(sender, instance, **kwargs):
+    """Списки, из которых рецепт удалён каскадом, заполнятся заново."""
+    Recipe.objects.filter(
+        pk__in=getattr(instance, 'similar_recipe_ids', ())
+    ).mark_similar_stale()
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance, **kwargs):
+    """Короткая ссылка удалённого рецепта больше не разрешается из кэша."""
+    cache.delete(short_link_key(instance.pk))
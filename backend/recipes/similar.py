@@ -0,0 +1,210 @@
+"""Похожие рецепты: MinHash-подписи и LSH по ингредиентам и тегам."""
+
+from itertools import islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from recipes.models import (Recipe, RecipeIngredient, RecipeSignature,
+                            SimilarRecipe)
+
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+MINHASH_PRIME = (1 << 31) - 1
+MINHASH_SEED = 1729
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_BATCH_SIZE = 1000
+
+_random = np.random.RandomState(MINHASH_SEED)
+HASH_A = _random.randint(
+    1, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64
+)
+HASH_B = _random.randint(
+    0, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64
+)
+BAND_COEFFICIENTS = _random.randint(
+    1, MINHASH_PRIME, LSH_ROWS, dtype=np.uint64
+)
+
+
+def batches(iterable, size=SIMILAR_BATCH_SIZE):
+    """Списки по size элементов."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def recipe_features(recipe_ids):
+    """
+    Множества признаков рецептов: ингредиенты и теги.
+
+    Признаки кодируются числами: чётные для ингредиентов, нечётные
+    для тегов.
+    """
+    features = {recipe_id: [] for recipe_id in recipe_ids}
+    ingredients = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id')
+    for recipe_id, ingredient_id in ingredients:
+        features[recipe_id].append(ingredient_id * 2)
+    tags = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in tags:
+        features[recipe_id].append(tag_id * 2 + 1)
+    return features
+
+
+def minhash(features):
+    """MinHash-подпись множества признаков."""
+    if not features:
+        return np.full(MINHASH_PERMUTATIONS, MINHASH_PRIME, dtype=np.uint64)
+    values = np.asarray(features, dtype=np.uint64)
+    return (
+        (HASH_A[:, None] * values[None, :] + HASH_B[:, None]) % MINHASH_PRIME
+    ).min(axis=1)
+
+
+def update_signatures(full=False):
+    """
+    Пересчитывает подписи рецептов, изменённых после прошлого расчёта.
+
+    Изменённые — с pub_date или similar_modified позже расчёта: второе
+    ставят изменение ингредиентов и удаление рецепта из списка похожих,
+    не меняя даты публикации. Время расчёта фиксируется до чтения
+    признаков: рецепт, сохранённый во время расчёта, будет пересчитан
+    при следующем запуске.
+    """
+    stale = Recipe.objects.all()
+    if not full:
+        stale = stale.filter(
+            Q(signature__isnull=True)
+            | Q(pub_date__gt=F('signature__computed_at'))
+            | Q(similar_modified__gt=F('signature__computed_at'))
+        )
+    changed = list(stale.values_list('id', flat=True))
+    computed_at = timezone.now()
+    for batch in batches(changed):
+        signatures = [
+            RecipeSignature(
+                recipe_id=recipe_id, computed_at=computed_at,
+                signature=minhash(features).astype('<u4').tobytes()
+            )
+            for recipe_id, features in recipe_features(batch).items()
+        ]
+        with transaction.atomic():
+            RecipeSignature.objects.filter(recipe_id__in=batch).delete()
+            RecipeSignature.objects.bulk_create(signatures)
+    return changed
+
+
+def load_signatures():
+    """id рецептов и матрица их подписей."""
+    ids = []
+    rows = []
+    signatures = RecipeSignature.objects.order_by('recipe_id').values_list(
+        'recipe_id', 'signature'
+    ).iterator(chunk_size=SIMILAR_BATCH_SIZE)
+    for recipe_id, signature in signatures:
+        row = np.frombuffer(bytes(signature), dtype='<u4')
+        if len(row) == MINHASH_PERMUTATIONS:
+            ids.append(recipe_id)
+            rows.append(row)
+    if not rows:
+        return ids, np.empty((0, MINHASH_PERMUTATIONS), dtype=np.uint32)
+    return ids, np.vstack(rows)
+
+
+class SignatureIndex:
+    """
+    LSH-индекс подписей.
+
+    Подпись делится на LSH_BANDS полос по LSH_ROWS значений, рецепты с
+    совпадающей полосой попадают в одну корзину. Кандидаты в похожие —
+    рецепты из общих корзин, их сходство оценивается по доле совпавших
+    значений подписи.
+    """
+
+    def __init__(self, ids, matrix):
+        """Корзины по всем полосам подписей."""
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.matrix = matrix
+        self.positions = {
+            recipe_id: index for index, recipe_id in enumerate(ids)
+        }
+        self.keys = []
+        self.buckets = []
+        for band in range(LSH_BANDS):
+            rows = matrix[:, band * LSH_ROWS:(band + 1) * LSH_ROWS]
+            keys = (rows.astype(np.uint64) * BAND_COEFFICIENTS).sum(axis=1)
+            buckets = {}
+            for index, key in enumerate(keys.tolist()):
+                buckets.setdefault(key, []).append(index)
+            self.keys.append(keys.tolist())
+            self.buckets.append(buckets)
+
+    def candidates(self, index):
+        """Позиции рецептов из общих с index корзин."""
+        found = set()
+        for keys, buckets in zip(self.keys, self.buckets):
+            found.update(buckets[keys[index]])
+        found.discard(index)
+        return found
+
+    def similar(self, recipe_id):
+        """Самые похожие рецепты: список (id, сходство)."""
+        index = self.positions[recipe_id]
+        candidates = np.array(sorted(self.candidates(index)), dtype=np.int64)
+        if not len(candidates):
+            return []
+        scores = (self.matrix[candidates] == self.matrix[index]).mean(axis=1)
+        top = np.argsort(-scores, kind='stable')[:SIMILAR_RECIPES_COUNT]
+        return [
+            (int(self.ids[candidates[position]]), float(scores[position]))
+            for position in top if scores[position] > 0
+        ]
+
+
+def update_similar(full=False):
+    """
+    Пересчитывает похожие рецепты.
+
+    Списки обновляются у изменённых рецептов, у рецептов из общих с
+    ними корзин и у тех, в чьих списках они были. Возвращает число
+    изменённых рецептов и обновлённых списков.
+    """
+    changed = update_signatures(full)
+    if not changed:
+        return 0, 0
+    index = SignatureIndex(*load_signatures())
+    if full:
+        affected = set(index.positions)
+    else:
+        affected = set(changed)
+        for recipe_id in changed:
+            if recipe_id in index.positions:
+                affected.update(
+                    int(index.ids[position]) for position in
+                    index.candidates(index.positions[recipe_id])
+                )
+        for batch in batches(changed):
+            affected.update(SimilarRecipe.objects.filter(
+                similar_id__in=batch
+            ).values_list('recipe_id', flat=True))
+    for batch in batches(sorted(affected)):
+        rows = [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id in batch if recipe_id in index.positions
+            for similar_id, score in index.similar(recipe_id)
+        ]
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+            SimilarRecipe.objects.bulk_create(rows)
+    return len(changed), len(affected)
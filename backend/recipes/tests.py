@@ -0,0 +1,222 @@
+"""Тесты рецептов."""
+
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from recipes import pantry, similar
+from recipes.ingredients import changing_ingredients
+from recipes.models import (Ingredient, PantryChange, Recipe, RecipeIngredient,
+                            ShoppingCart, SimilarRecipe)
+from recipes.relations import add_user_recipes
+from users.models import User
+
+
+class PantryIndexTest(TestCase):
+    """Индекс продуктов и его журнал."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Два рецепта: с ингредиентами 0, 1 и с ингредиентами 1, 2, 3."""
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(4)
+        ]
+        cls.first = cls.create_recipe(cls.ingredients[:2])
+        cls.second = cls.create_recipe(cls.ingredients[1:])
+
+    @classmethod
+    def create_recipe(cls, ingredients):
+        """Рецепт с ингредиентами."""
+        recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            cooking_time=1, image='recipes/images/recipe.png'
+        )
+        cls.set_ingredients(recipe, ingredients)
+        return recipe
+
+    @staticmethod
+    def set_ingredients(recipe, ingredients):
+        """Заменяет ингредиенты рецепта так же, как API и админка."""
+        with changing_ingredients((recipe.id,)):
+            RecipeIngredient.objects.filter(recipe=recipe).delete()
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=1)
+                for ingredient in ingredients
+            )
+
+    def setUp(self):
+        """Каждый тест начинает без индекса в памяти процесса."""
+        pantry._index = None
+
+    def rank(self, *numbers):
+        """Ранжирование по номерам ингредиентов из setUpTestData."""
+        return pantry.get_pantry_index().rank(
+            self.ingredients[number].id for number in numbers
+        )
+
+    def assert_matches_rebuild(self, index):
+        """Индекс ранжирует так же, как собранный заново."""
+        fresh = pantry.PantryIndex.build(timezone.now())
+        for ingredient in self.ingredients:
+            self.assertEqual(
+                index.rank((ingredient.id,)), fresh.rank((ingredient.id,))
+            )
+
+    def test_rank(self):
+        """Сначала большая доля имеющихся, затем меньше недостающих."""
+        self.assertEqual(self.rank(1), [
+            (self.first.id, 0.5, 1),
+            (self.second.id, 1 / 3, 2),
+        ])
+        self.assertEqual(self.rank(1, 2, 3)[0], (self.second.id, 1.0, 0))
+        self.assertEqual(self.rank(), [])
+
+    def test_changes_are_applied_without_rebuild(self):
+        """Изменённый рецепт перечитывается без полной сборки."""
+        before = pantry.get_pantry_index()
+        self.set_ingredients(self.second, self.ingredients[:1])
+        with mock.patch.object(
+            pantry.PantryIndex, 'build', side_effect=AssertionError
+        ):
+            index = pantry.get_pantry_index()
+        self.assertGreater(index.sequence, before.sequence)
+        self.assertEqual(self.rank(0), [
+            (self.second.id, 1.0, 0),
+            (self.first.id, 0.5, 1),
+        ])
+        self.assertEqual(before.rank((self.ingredients[3].id,)), [
+            (self.second.id, 1 / 3, 2),
+        ])
+        self.assert_matches_rebuild(index)
+
+    def test_deleted_recipe_leaves_index(self):
+        """Удалённый рецепт пропадает из выдачи."""
+        pantry.get_pantry_index()
+        self.first.delete()
+        self.assertEqual(self.rank(0), [])
+        self.assert_matches_rebuild(pantry.get_pantry_index())
+
+    def test_gap_waits_for_grace(self):
+        """Позиция не переходит через свежий пропуск в номерах журнала."""
+        sequence = pantry.get_pantry_index().sequence
+        RecipeIngredient.objects.filter(recipe=self.first).delete()
+        change = PantryChange.objects.create(
+            id=sequence + 2, recipe_id=self.first.id
+        )
+        index = pantry.get_pantry_index()
+        self.assertEqual(index.sequence, sequence)
+        self.assertEqual(self.rank(0), [])
+        PantryChange.objects.filter(pk=change.pk).update(
+            created=timezone.now() - pantry.PANTRY_CHANGE_GRACE * 2
+        )
+        self.assertEqual(pantry.get_pantry_index().sequence, change.id)
+
+    def test_rebuild_after_retention(self):
+        """Процесс, долго не сверявшийся с журналом, строит индекс заново."""
+        expired = timezone.now() - pantry.PANTRY_CHANGE_RETENTION * 2
+        pantry._index = pantry.get_pantry_index().synced_at(expired)
+        PantryChange.objects.update(created=expired)
+        with mock.patch.object(
+            pantry.PantryIndex, 'build', wraps=pantry.PantryIndex.build
+        ) as build:
+            index = pantry.get_pantry_index()
+        build.assert_called_once()
+        self.assertFalse(PantryChange.objects.exists())
+        self.assert_matches_rebuild(index)
+
+
+class SimilarRecipesTest(TestCase):
+    """Пересчёт похожих рецептов без полного прохода."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Три рецепта с одинаковыми ингредиентами."""
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name='Рецепт', text='Текст',
+                cooking_time=1, image='recipes/images/recipe.png'
+            )
+            for _ in range(3)
+        ]
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=cls.ingredient,
+                             amount=1)
+            for recipe in cls.recipes
+        )
+
+    def setUp(self):
+        """Списки посчитаны, изменений после расчёта нет."""
+        similar.update_similar(full=True)
+        self.assertEqual(similar.update_similar(), (0, 0))
+
+    def similar_ids(self, recipe):
+        """id похожих рецептов из таблицы."""
+        return set(SimilarRecipe.objects.filter(
+            recipe=recipe
+        ).values_list('similar_id', flat=True))
+
+    def test_ingredient_change_is_recomputed(self):
+        """Строки ингредиентов из админки меняют похожие без pub_date."""
+        first, second, third = self.recipes
+        pub_date = Recipe.objects.get(pk=first.pk).pub_date
+        with changing_ingredients((first.id,)):
+            RecipeIngredient.objects.filter(recipe=first).update(
+                ingredient=Ingredient.objects.create(
+                    name='Другой', measurement_unit='г'
+                )
+            )
+        self.assertEqual(Recipe.objects.get(pk=first.pk).pub_date, pub_date)
+        self.assertEqual(similar.update_similar()[0], 1)
+        self.assertEqual(self.similar_ids(first), set())
+        self.assertEqual(self.similar_ids(second), {third.id})
+
+    def test_deleted_recipe_is_refilled(self):
+        """Списки, где был удалённый рецепт, пересчитываются."""
+        first, second, third = self.recipes
+        first.delete()
+        self.assertEqual(similar.update_similar(), (2, 2))
+        self.assertEqual(self.similar_ids(second), {third.id})
+
+
+class ShoppingCartVersionTest(TestCase):
+    """Версия списка покупок для кэша документа."""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Пользователь и рецепт."""
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст',
+            cooking_time=1, image='recipes/images/recipe.png'
+        )
+
+    def version(self):
+        """Текущая версия списка покупок пользователя."""
+        return User.objects.get(pk=self.user.pk).shopping_cart_version
+
+    def test_version_grows_only_on_insert(self):
+        """Повторное добавление рецепта в корзину не меняет версию."""
+        version = self.version()
+        add_user_recipes(ShoppingCart, self.user.id, [self.recipe.id])
+        self.assertEqual(self.version(), version + 1)
+        self.assertEqual(
+            add_user_recipes(ShoppingCart, self.user.id, [self.recipe.id]),
+            []
+        )
+        self.assertEqual(self.version(), version + 1)
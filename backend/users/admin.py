@@ -3,6 +3,7 @@
 from django.contrib.admin import ModelAdmin, register
 from django.contrib.auth.admin import UserAdmin
 
+from recipes.relations import remove_follows
 from users.models import Follow, User
 
 
@@ -10,8 +11,12 @@ from users.models import Follow, User
 class CustomUserAdmin(UserAdmin):
     """Пользователь."""
 
-    list_display = ('username', 'email', 'first_name', 'last_name')
-    list_filter = ('username', 'email')
+    list_display = (
+        'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count'
+    )
+    list_filter = ('is_staff', 'is_active')
+    show_full_result_count = False
 
 
 @register(Follow)
@@ -19,3 +24,14 @@ class FollowAdmin(ModelAdmin):
     """Подписки."""
 
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
+
+    def delete_model(self, request, obj):
+        """Отписка с пересчётом счётчика и ленты."""
+        remove_follows(Follow.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        """Удаление выбранных подписок с пересчётом счётчиков и лент."""
+        remove_follows(queryset)
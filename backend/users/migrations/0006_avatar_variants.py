@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants',
+            field=models.JSONField(default=list, editable=False, verbose_name='Созданные копии аватара'),
+        ),
+    ]
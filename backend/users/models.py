@@ -1,8 +1,10 @@
 """Models пользователя."""
 
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import BooleanField, Exists, OuterRef, Value
 from rest_framework.exceptions import ValidationError
 
 from api.constants import (
@@ -11,6 +13,32 @@ from api.constants import (
 )
 
 
+class UserQuerySet(models.QuerySet):
+    """QuerySet пользователей с аннотациями для текущего пользователя."""
+
+    def with_is_subscribed(self, user):
+        """Аннотирует флаг подписки текущего пользователя на автора."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            )
+        )
+
+    def subscriptions(self, user):
+        """Авторы, на которых подписан user."""
+        return self.filter(following__user=user).with_is_subscribed(
+            user
+        ).order_by('id')
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    """Менеджер пользователей."""
+
+
 class User(AbstractUser):
     """Модель пользователя."""
 
@@ -41,6 +69,28 @@ class User(AbstractUser):
         default='users/image.png',
         blank=True
     )
+    avatar_variants = models.JSONField(
+        default=list,
+        editable=False,
+        verbose_name='Созданные копии аватара'
+    )
+    shopping_cart_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Версия списка покупок'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
+
+    objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'last_name', 'first_name')
@@ -92,3 +142,8 @@ class Follow(models.Model):
                 fields=['author', 'user'],
                 name='unique_follower')
         ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='follow_user_author_idx'
+            )
+        ]
@@ -1,5 +1,8 @@
 """View-функции пользовательской модели."""
 
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -10,8 +13,11 @@ from rest_framework.response import Response
 from api.paginations import LimitPagination
 from api.permissions import IsAuthorOrReadOnly
 from api.serializers import (
-    FollowSerializer, UserAvatarSerializer, UsersSerializer
+    FollowSerializer, RecipesLimitSerializer, UserAvatarSerializer,
+    UsersSerializer
 )
+from recipes.models import Recipe
+from recipes.relations import unsubscribe
 from users.models import Follow, User
 
 
@@ -22,6 +28,17 @@ class UsersViewSet(UserViewSet):
     serializer_class = UsersSerializer
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = LimitPagination
+    cursor_ordering = None
+
+    def get_queryset(self):
+        """Пользователи с флагом подписки текущего пользователя."""
+        return super().get_queryset().with_is_subscribed(self.request.user)
+
+    def get_recipes_limit(self):
+        """Проверенное значение параметра recipes_limit."""
+        serializer = RecipesLimitSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
 
     @action(
         methods=['POST', 'DELETE'],
@@ -35,30 +52,35 @@ class UsersViewSet(UserViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         user = request.user
-        author = get_object_or_404(User, id=id)
-        subscription = Follow.objects.filter(
-            user=user, author=author
-        )
 
         if request.method == 'POST':
-            if subscription.exists():
+            if int(id) == user.id:
                 return Response(
-                    {'error': 'Вы уже подписаны'},
+                    {'error': 'Невозможно подписаться на себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            if user == author:
+            author = get_object_or_404(User, id=id)
+            recipes_limit = self.get_recipes_limit()
+            try:
+                with transaction.atomic():
+                    Follow.objects.create(user=user, author=author)
+            except IntegrityError:
                 return Response(
-                    {'error': 'Невозможно подписаться на себя'},
+                    {'error': 'Вы уже подписаны'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            serializer = FollowSerializer(author, context={'request': request})
-            Follow.objects.create(user=user, author=author)
+            author.is_subscribed = True
+            serializer = FollowSerializer(author, context={
+                'request': request,
+                'recipes_limit': recipes_limit,
+            })
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if subscription.exists():
-                subscription.delete()
+            if unsubscribe(user.id, id):
                 return Response(status=status.HTTP_204_NO_CONTENT)
+            if not User.objects.filter(id=id).exists():
+                raise Http404
             return Response(
                 {'error': 'Вы не подписаны на этого пользователя'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -67,12 +89,19 @@ class UsersViewSet(UserViewSet):
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        cursor_ordering=('id',)
     )
     def subscriptions(self, request):
         """Подписка."""
         user = request.user
-        follows = User.objects.filter(following__user=user)
+        recipes = Recipe.objects.only(
+            'id', 'author', 'name', 'image', 'image_variants',
+            'cooking_time'
+        ).limited_per_author(self.get_recipes_limit())
+        follows = User.objects.subscriptions(user).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
         page = self.paginate_queryset(follows)
         serializer = FollowSerializer(
             page, many=True,
@@ -101,7 +130,8 @@ class UsersViewSet(UserViewSet):
             serializer = UserAvatarSerializer(
                 user, data=request.data)
         if request.method == 'DELETE':
-            user.avatar.delete()
+            user.avatar = None
+            user.save(update_fields=('avatar',))
             return Response(status=status.HTTP_204_NO_CONTENT)
         if serializer.is_valid():
             serializer.save()